@@ -1,58 +1,154 @@
+import functools
 import json
+import os
+import sys
 
+from chunkedtts import tts_cache_enabled
+from jobcontext import DEFAULT_JOB
+from pipeline import Stage, run_stages, build_arg_parser, module_files
 
-from scriptmaker import generate_script
-from audiomakereleven import generate_audio, read_script
-from transcript import generate_transcript
-from sentencetranscript import transcript_to_sentences
-from keywordcollector import process_json_file
-from mapping import map_keywords_and_timestamps
-from searchbytype import search_and_save_by_type
-from videomaker import create_video
+# Stage modules are imported lazily so cached stages don't need their API clients
 
 
-if __name__ == "__main__":
+def script_stage(job):
+    from scriptmaker import generate_script
     # Read the prompt from the summary.txt file
-    with open("output/summary.txt", "r") as file:
+    with open(job.summary_path, "r") as file:
         prompt = file.read()
-    
     # Generate the script using the prompt
-    generate_script(prompt)
+    result = generate_script(prompt, job=job)
+    if result.startswith("Error:"):
+        raise RuntimeError(result)
+
 
+def audio_stage(job, chunked=False):
+    from audiomakereleven import generate_audio, read_script
     # Generate audio from the script
-    script_file_path = "output/script.txt"
-    script_content = read_script(script_file_path)
-    generate_audio(script_content)
+    script_content = read_script(job.script_path)
+    if generate_audio(script_content, job=job, chunked=chunked) is None:
+        raise RuntimeError("Audio generation failed")
+
 
+def transcript_stage(job):
+    from transcript import generate_transcript
     # Generate transcript from the audio file
-    audio_file_path = "output/audio.mp3"
-    generate_transcript(audio_file_path)
+    generate_transcript(job.audio_path, job=job)
 
+
+def sentences_stage(job):
+    from sentencetranscript import transcript_to_sentences
     # generarate sentence transcript
-    transcript_file_path = "output/transcript.json"
-    transcript_to_sentences(transcript_file_path)
+    transcript_to_sentences(job.transcript_path, job=job)
+
 
+def keywords_stage(job):
+    from keywordcollector import process_json_file
     # keyword collector
-    sentence_file_path = "output/sentence_transcript_with_ids.json"  # Replace with your JSON file path
-    process_json_file(sentence_file_path)
-    
+    process_json_file(job.sentences_path, job=job)
+
+
+def mapping_stage(job, mode="greedy"):
+    from mapping import map_keywords_and_timestamps
     # keyword to transcript maker mapping
-    keywords_file = "output/keywords.json"
-    mapping_output_file = "output/mapped.json"
-    
-    result = map_keywords_and_timestamps(keywords_file, transcript_file_path, mapping_output_file)
-    print(f"Processing complete. Output saved to {mapping_output_file}")
+    map_keywords_and_timestamps(job.keywords_path, job.transcript_path, job.mapped_path, job=job,
+                                mode=mode, sentences_file_path=job.sentences_path)
+    print(f"Processing complete. Output saved to {job.mapped_path}")
+
 
+def media_stage(job, render_text=False, workers=None):
+    from searchbytype import DOWNLOAD_WORKERS, search_and_save_by_type
     # search content by type
-    search_and_save_by_type(mapping_output_file)
+    # text keywords are rendered procedurally by create_video
+    # workers bounds both text renders and downloads, e.g. a batch job's share of the box
+    os.makedirs(job.media_dir, exist_ok=True)
+    search_and_save_by_type(job.mapped_path, render_text=render_text, workers=workers or os.cpu_count(),
+                            download_workers=workers or DOWNLOAD_WORKERS)
+
+
+def stream_stage(job, workers=None):
+    from searchbytype import DOWNLOAD_WORKERS
+    from streampipeline import run_streaming_pipeline
+    # keywords, mapping and media overlapped in one streaming pipeline
+    os.makedirs(job.media_dir, exist_ok=True)
+    run_streaming_pipeline(job, download_workers=workers or DOWNLOAD_WORKERS)
+    print(f"Processing complete. Output saved to {job.mapped_path}")
 
+
+def video_stage(job, backend="timeline"):
+    from normalizemedia import normalize_media
+    from videomaker import create_video
     # video maker
-    output_path = 'output_video.mp4'
+    with open(job.mapped_path, 'r') as file:
+        data = json.load(file)
+    # resize and pad all media to the final frame size once
+    data = normalize_media(data)
+    create_video(data, job.audio_path, job.output_video_path, backend=backend)
+    print(f"Video successfully created at: {job.output_video_path}")
+
+
+def build_stages(job=DEFAULT_JOB, media_workers=None, stream=False, align="greedy", chunked_tts=False):
+    """
+    Describe the pipeline for one job workspace.
+
+    Each stage also depends on its modules and every repo module they import, so
+    editing a module (e.g. a video template tweak) only re-runs the stages using
+    it and the ones after them.
+    With stream=True keywords, mapping and media run as one overlapped stage.
+    align picks the mapping mode, "greedy" or "global". The narration is
+    synthesized in packed sentence chunks through the TTS cache, sentence by
+    sentence with chunked_tts, or in one request when neither applies; the
+    chunked runs also write the job's audio_chunks.json.
+    """
+    audio_outputs = [job.audio_path]
+    if chunked_tts or tts_cache_enabled():
+        audio_outputs.append(job.audio_chunks_path)
+
+    def sources(*modules):
+        # The stage wrappers above resolve every path through the JobContext
+        return module_files(*modules, "jobcontext.py")
+
+    stages = [
+        Stage("script", [job.summary_path, *sources("scriptmaker.py")], [job.script_path],
+              functools.partial(script_stage, job)),
+        Stage("audio", [job.script_path, *sources("audiomakereleven.py")], audio_outputs,
+              functools.partial(audio_stage, job), params={"chunked": chunked_tts}),
+        Stage("transcript", [job.audio_path, *sources("transcript.py")], [job.transcript_path],
+              functools.partial(transcript_stage, job)),
+        Stage("sentences", [job.transcript_path, *sources("sentencetranscript.py")], [job.sentences_path],
+              functools.partial(sentences_stage, job)),
+        Stage("keywords", [job.sentences_path, *sources("keywordcollector.py")], [job.keywords_path],
+              functools.partial(keywords_stage, job)),
+        Stage("mapping", [job.keywords_path, job.transcript_path, job.sentences_path, *sources("mapping.py")],
+              [job.mapped_path], functools.partial(mapping_stage, job), params={"mode": align}),
+        Stage("media", [job.mapped_path, *sources("searchbytype.py")], [job.media_dir],
+              functools.partial(media_stage, job, workers=media_workers), params={"render_text": False}),
+        Stage("video", [job.mapped_path, job.audio_path, job.media_dir,
+                        *sources("videomaker.py", "normalizemedia.py")], [job.output_video_path],
+              functools.partial(video_stage, job), params={"backend": "timeline"}),
+    ]
+    if stream:
+        streamed = ("keywords", "mapping", "media")
+        stages = [stage for stage in stages if stage.name not in streamed]
+        stages.append(
+            Stage("stream", [job.sentences_path, job.transcript_path, *sources("streampipeline.py")],
+                  [job.keywords_path, job.mapped_path, job.media_dir],
+                  functools.partial(stream_stage, job, workers=media_workers))
+        )
+    return stages
+
+
+if __name__ == "__main__":
+    stream = "--stream" in sys.argv
+    align = "global" if "--global-align" in sys.argv else "greedy"
+    chunked_tts = "--chunked-tts" in sys.argv
+    stages = build_stages(stream=stream, align=align, chunked_tts=chunked_tts)
+    parser = build_arg_parser(stages)
+    parser.add_argument("--stream", action="store_true", help="overlap keywords, mapping and media")
+    parser.add_argument("--global-align", action="store_true", help="align all keywords to the transcript at once")
+    parser.add_argument("--chunked-tts", action="store_true",
+                        help="synthesize and cache the narration sentence by sentence")
+    args = parser.parse_args()
     try:
-        with open(mapping_output_file, 'r') as file:
-            data = json.load(file)
-        create_video(data, audio_file_path, output_path)
-        print(f"Video successfully created at: {output_path}")
-        
+        run_stages(stages, start=args.start, stop=args.stop, force=args.force, cache_dir=DEFAULT_JOB.stage_cache_dir)
     except Exception as e:
-        print(f"Error: {e}")
\ No newline at end of file
+        print(f"Error: {e}")
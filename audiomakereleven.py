@@ -3,8 +3,14 @@ from elevenlabs.client import ElevenLabs
 from elevenlabs import play
 import os
 
+from chunkedtts import CHUNK_CHARS, generate_chunked_audio, tts_cache_enabled
+from jobcontext import DEFAULT_JOB
+from ratelimit import call_with_retry
 load_dotenv()
 
+# Chunks synthesized at once in chunked mode, keep within the plan's concurrency limit
+TTS_WORKERS = int(os.getenv("ELEVENLABS_CONCURRENCY", "2"))
+
 # Get API key from environment variables
 api_key = os.getenv('ELEVENLABS_API_KEY')
 if not api_key:
@@ -17,7 +23,20 @@ def read_script(file_path):
     with open(file_path, 'r', encoding='utf-8') as file:
         return file.read()
 
-def generate_audio(script):
+def generate_audio(script, job=None, chunked=False, workers=TTS_WORKERS, use_cache=True):
+    """
+    Narrate script into the job's audio.mp3 and return its path, or None on failure.
+
+    The script is split into chunks of whole sentences (never spanning a
+    paragraph) that are synthesized in parallel and stitched without gaps, and
+    each chunk's offset is written to the job's audio_chunks.json. With
+    use_cache (and the TTS cache enabled) chunks are read through the TTS cache,
+    so only chunks changed since an earlier run are sent to ElevenLabs;
+    chunked=True caches sentence by sentence, which saves more requests on
+    edits at the cost of a break at every sentence. Without the cache, chunked
+    packs the chunks and otherwise the script is one request.
+    """
+    job = job or DEFAULT_JOB
     print("Generating Audio...")
 
     # Voice ID and model ID for ElevenLabs
@@ -25,27 +44,39 @@ def generate_audio(script):
     model_id = "eleven_multilingual_v2"  # Replace with your desired model ID
 
     # Output folder
-    output_dir = "output"
+    output_dir = job.root
     os.makedirs(output_dir, exist_ok=True)  # Create folder if it doesn't exist
 
     # File path for the audio output
-    file_path = os.path.join(output_dir, "audio.mp3")
+    file_path = job.audio_path
 
-    try:
+    def synthesize(text=script, path=file_path):
         # Generate audio using ElevenLabs API
         audio_stream = client.text_to_speech.convert(
-            text=script,
+            text=text,
             voice_id=voice_id,
             model_id=model_id,
             output_format="mp3_44100_128",
         )
 
         # Save the audio to a file by consuming the generator
-        with open(file_path, "wb") as audio_file:
+        with open(path, "wb") as audio_file:
             # Iterate through the generator and write each chunk
             for chunk in audio_stream:
                 audio_file.write(chunk)
 
+    try:
+        cached = use_cache and tts_cache_enabled()
+        if chunked or cached:
+            voice_settings = {"voice_id": voice_id, "model_id": model_id, "output_format": "mp3_44100_128"}
+            generate_chunked_audio(script, file_path, synthesize, "elevenlabs", workers=workers,
+                                   chunks_path=job.audio_chunks_path, extension="mp3",
+                                   max_chars=0 if chunked and cached else CHUNK_CHARS,
+                                   voice_settings=voice_settings if cached else None)
+        else:
+            # The stream can fail part way, so a retry regenerates the whole file
+            call_with_retry("elevenlabs", synthesize)
+
         print(f"Audio generated and saved as {file_path}")
         return file_path  # Return the file path of the saved audio file
 
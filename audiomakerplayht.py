@@ -3,8 +3,15 @@ from pyht.client import TTSOptions
 from dotenv import load_dotenv
 import os
 
+from chunkedtts import CHUNK_CHARS, generate_chunked_audio, tts_cache_enabled
+from jobcontext import DEFAULT_JOB
+from ratelimit import call_with_retry
+
 load_dotenv()
 
+# Chunks synthesized at once in chunked mode
+TTS_WORKERS = int(os.getenv("PLAYHT_CONCURRENCY", "2"))
+
 # Play.ht API credentials
 USER_ID = os.getenv('PLAY_USER_ID')
 SECRET_KEY = os.getenv('PLAY_SECRET_KEY')
@@ -18,7 +25,14 @@ def read_script(file_path):
         return file.read()
 
 
-def generate_audio(script):
+def generate_audio(script, job=None, chunked=False, workers=TTS_WORKERS, use_cache=True):
+    """
+    Narrate script into the job's audio/audio.wav and return its path, or None on failure.
+    Like the ElevenLabs backend, packed sentence chunks are synthesized in parallel
+    through the TTS cache unless use_cache is False, and chunked=True caches
+    sentence by sentence.
+    """
+    job = job or DEFAULT_JOB
 
     print("Generating Audio...")
      # Voice manifest URL (or fallback voice)
@@ -30,18 +44,29 @@ def generate_audio(script):
     )
 
     # output folder
-    output_dir = "output/audio"
+    output_dir = job.path("audio")
     os.makedirs(output_dir,exist_ok=True) #create folder if not already exist
 
     # file path for the audio outpu
     file_path = os.path.join(output_dir,"audio.wav")
 
-    try:
+    def synthesize(text=script, path=file_path):
         # open the output file to write the audio
-        with open(file_path,"wb") as audio_file:
-            for chunk in client.tts(script,options,voice_engine='PlayDialog-http'):
+        with open(path,"wb") as audio_file:
+            for chunk in client.tts(text,options,voice_engine='PlayDialog-http'):
                 # write the audio chunk to the file
                 audio_file.write(chunk)
+
+    try:
+        cached = use_cache and tts_cache_enabled()
+        if chunked or cached:
+            voice_settings = {"voice": voice_manifest_url, "voice_engine": "PlayDialog-http"}
+            generate_chunked_audio(script, file_path, synthesize, "playht", workers=workers,
+                                   chunks_path=job.audio_chunks_path, extension="wav",
+                                   max_chars=0 if chunked and cached else CHUNK_CHARS,
+                                   voice_settings=voice_settings if cached else None)
+        else:
+            call_with_retry("playht", synthesize)
         print(f"audio generated and saved as{file_path}")
         return file_path #return file path of saved audio file
     except Exception as e:
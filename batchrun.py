@@ -0,0 +1,59 @@
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from app import build_stages
+from jobcontext import JobContext
+from pipeline import run_stages
+
+# Every job gets its own workspace under this folder
+JOBS_ROOT = "jobs"
+
+
+def run_job(prompt, job_root, media_workers=None):
+    """Run the whole pipeline for one prompt inside its own workspace"""
+    job = JobContext(job_root)
+    os.makedirs(job.root, exist_ok=True)
+    with open(job.summary_path, "w", encoding="utf-8") as file:
+        file.write(prompt)
+
+    run_stages(build_stages(job, media_workers=media_workers), cache_dir=job.stage_cache_dir)
+    return job.output_video_path
+
+
+def run_batch(prompts, jobs_root=JOBS_ROOT, workers=2, media_workers=None):
+    """
+    Produce one video per prompt, running up to `workers` jobs concurrently.
+
+    Jobs are numbered in prompt order (jobs/job_001, jobs/job_002, ...). Returns
+    a list of output video paths, or None for jobs that failed, in prompt order.
+    media_workers limits each job's concurrent downloads and text renders so jobs
+    don't oversubscribe the box.
+    """
+    media_workers = media_workers or max(1, (os.cpu_count() or 1) // workers)
+    results = [None] * len(prompts)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(run_job, prompt, os.path.join(jobs_root, f"job_{index:03d}"), media_workers): index
+            for index, prompt in enumerate(prompts, start=1)
+        }
+        for future in as_completed(futures):
+            index = futures[future]
+            try:
+                results[index - 1] = future.result()
+                print(f"Job {index} finished: {results[index - 1]}")
+            except Exception as e:
+                print(f"Job {index} failed: {e}")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Produce a video for every prompt in a file (one prompt per line).")
+    parser.add_argument("prompts_file")
+    parser.add_argument("--workers", type=int, default=2, help="number of jobs to run at once")
+    parser.add_argument("--jobs-root", default=JOBS_ROOT)
+    args = parser.parse_args()
+
+    with open(args.prompts_file, "r", encoding="utf-8") as file:
+        prompts = [line.strip() for line in file if line.strip()]
+    run_batch(prompts, jobs_root=args.jobs_root, workers=args.workers)
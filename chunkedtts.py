@@ -0,0 +1,173 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from moviepy.config import get_setting
+
+from mediacache import MediaCache
+from sqlitecache import cache_enabled, get_cache
+from ratelimit import call_with_retry
+
+# Longest chunk sent in one TTS request; whole sentences are packed up to it
+CHUNK_CHARS = 800
+# Chunks are decoded to this PCM format before stitching
+SAMPLE_RATE = 44100
+CHANNELS = 1
+SAMPLE_BYTES = 2
+
+# Synthesized chunks, so an edited script only pays for the chunks that changed
+TTS_CACHE_DIR = "output/cache/tts"
+TTS_CACHE_TTL = 365 * 24 * 3600
+TTS_CACHE_MAX_BYTES = 2 * 1024 ** 3
+
+
+def split_script(script, max_chars=CHUNK_CHARS):
+    """
+    Split a script into chunks on paragraph and sentence boundaries.
+
+    Sentences of a paragraph are packed together while the chunk stays within
+    max_chars; a chunk never spans two paragraphs. A single sentence longer than
+    max_chars becomes a chunk of its own.
+    """
+    chunks = []
+    for paragraph in re.split(r'\n\s*\n', script):
+        chunk = ""
+        for sentence in re.split(r'(?<=[.!?])\s+', paragraph.strip()):
+            sentence = " ".join(sentence.split())
+            if not sentence:
+                continue
+            if chunk and len(chunk) + 1 + len(sentence) > max_chars:
+                chunks.append(chunk)
+                chunk = sentence
+            else:
+                chunk = f"{chunk} {sentence}" if chunk else sentence
+        if chunk:
+            chunks.append(chunk)
+    return chunks
+
+
+def tts_cache_enabled():
+    """False when the TTS cache is disabled with TTS_CACHE=off"""
+    return cache_enabled("TTS_CACHE")
+
+
+def get_tts_cache():
+    """Process wide MediaCache for TTS segments, or None when disabled with TTS_CACHE=off"""
+    return get_cache(MediaCache, "TTS", TTS_CACHE_DIR, TTS_CACHE_TTL, TTS_CACHE_MAX_BYTES)
+
+
+def segment_key(voice_settings, text):
+    """Cache key for one sentence: the voice settings plus the whitespace normalized text"""
+    request = dict(voice_settings, text=" ".join(text.split()))
+    return hashlib.sha256(json.dumps(request, sort_keys=True).encode()).hexdigest()
+
+
+def decode_pcm(path):
+    """Decode an audio file to raw PCM in the stitching format"""
+    command = [
+        get_setting("FFMPEG_BINARY"), '-loglevel', 'error',
+        '-i', path,
+        '-f', 's16le', '-acodec', 'pcm_s16le', '-ar', str(SAMPLE_RATE), '-ac', str(CHANNELS),
+        'pipe:1'
+    ]
+    result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed to decode {path}: {result.stderr.decode(errors='replace')}")
+    return result.stdout
+
+
+def stitch_chunks(chunk_paths, output_path):
+    """
+    Join chunk files into output_path without gaps and return each chunk's
+    (offset, duration) in seconds.
+
+    Every chunk is decoded to PCM, which drops codec padding such as the mp3
+    encoder delay, and the samples are encoded once, so no silence or clicks
+    are added at the joins. The output codec follows output_path's extension.
+    """
+    codec = ['-c:a', 'libmp3lame', '-b:a', '128k'] if output_path.endswith('.mp3') else ['-c:a', 'pcm_s16le']
+    command = [
+        get_setting("FFMPEG_BINARY"), '-y', '-loglevel', 'error',
+        '-f', 's16le', '-ar', str(SAMPLE_RATE), '-ac', str(CHANNELS), '-i', 'pipe:0',
+        *codec,
+        output_path
+    ]
+    process = subprocess.Popen(command, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+    timings = []
+    samples = 0
+    try:
+        for path in chunk_paths:
+            pcm = decode_pcm(path)
+            chunk_samples = len(pcm) // (SAMPLE_BYTES * CHANNELS)
+            timings.append((samples / SAMPLE_RATE, chunk_samples / SAMPLE_RATE))
+            samples += chunk_samples
+            process.stdin.write(pcm)
+    finally:
+        process.stdin.close()
+        stderr = process.stderr.read()
+        process.wait()
+    if process.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed to write {output_path}: {stderr.decode(errors='replace')}")
+    return timings
+
+
+def generate_chunked_audio(script, output_path, synthesize, provider, workers=2, chunks_path=None,
+                           extension="mp3", max_chars=CHUNK_CHARS, voice_settings=None):
+    """
+    Synthesize a script chunk by chunk in parallel and stitch it into output_path.
+
+    synthesize(text, path) must write the audio for one chunk to path. Up to
+    workers chunks are synthesized at once, each through the provider's rate
+    limiter, and a failed chunk is retried on its own instead of regenerating
+    the whole script. Each chunk's text, offset and duration is written to
+    chunks_path when given. Returns output_path.
+
+    With voice_settings (e.g. voice, model and output format) every chunk is
+    read through the TTS cache, so after a script edit only the chunks that
+    changed are synthesized again; max_chars=0 caches sentence by sentence.
+    """
+    cache = get_tts_cache() if voice_settings is not None else None
+    chunks = split_script(script, max_chars)
+    if not chunks:
+        raise ValueError("Script is empty")
+
+    temp_dir = tempfile.mkdtemp(prefix="tts_chunks_")
+    try:
+        chunk_paths = [os.path.join(temp_dir, f"chunk_{i:04d}.{extension}") for i in range(len(chunks))]
+        if cache is not None:
+            keys = [segment_key(dict(voice_settings, provider=provider), text) for text in chunks]
+            cached = [bool(cache.fetch(provider, key, path)) for key, path in zip(keys, chunk_paths)]
+        else:
+            keys = None
+            cached = [False] * len(chunks)
+
+        def synthesize_chunk(index):
+            call_with_retry(provider, synthesize, chunks[index], chunk_paths[index])
+            if cache is not None:
+                cache.store(provider, keys[index], chunk_paths[index])
+
+        missing = [i for i, hit in enumerate(cached) if not hit]
+        print(f"Synthesizing {len(missing)} of {len(chunks)} chunks with {workers} workers...")
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(synthesize_chunk, i) for i in missing]
+            for future in futures:
+                future.result()
+
+        output_dir = os.path.dirname(output_path)
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        timings = stitch_chunks(chunk_paths, output_path)
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+    if chunks_path:
+        with open(chunks_path, 'w', encoding='utf-8') as f:
+            json.dump([
+                {"index": i, "text": text, "offset": offset, "duration": duration, "cached": hit}
+                for i, (text, (offset, duration), hit) in enumerate(zip(chunks, timings, cached))
+            ], f, ensure_ascii=False, indent=4)
+    return output_path
@@ -0,0 +1,147 @@
+import bisect
+from collections import OrderedDict
+import numpy as np
+from moviepy.editor import VideoClip
+
+
+class SequentialTimelineClip(VideoClip):
+    """
+    Compositor for strictly sequential, non-overlapping timelines.
+
+    CompositeVideoClip checks every clip on every frame and blends a background
+    under it. Here the (start, end) intervals are indexed once, sorted by start,
+    and each frame looks up the single active clip with a cursor (amortized O(1)
+    for in-order rendering, O(log n) bisect on seeks). Clips are centered on a
+    black canvas that is only cleared when the placed area changes, and a clip
+    that covers the whole frame is returned without any background work.
+
+    A source can also be a zero argument function returning the clip (or None).
+    Such clips are opened when their interval starts and closed once it has
+    ended, with at most max_open of them open at the same time, so long scripts
+    don't keep one ffmpeg reader per GIF or text clip alive for the whole render.
+    """
+
+    def __init__(self, timed_clips, size, duration, bg_color=(0, 0, 0), max_open=2):
+        """timed_clips is a list of (start_sec, end_sec, clip or clip factory) tuples"""
+        intervals = sorted(
+            ((start, end, clip) for start, end, clip in timed_clips if end > start),
+            key=lambda item: item[0]
+        )
+        self.starts = [start for start, _, _ in intervals]
+        self.intervals = intervals
+        self.cursor = 0
+        self.bg_color = bg_color
+
+        self.max_open = max(1, max_open)
+        self.open_clips = OrderedDict()  # interval index -> lazily opened clip
+        self.peak_open = 0
+
+        width, height = size
+        self.canvas = np.zeros((height, width, 3), dtype=np.uint8)
+        self.canvas[:] = bg_color
+        self.placed = None  # (y, x, h, w) of the area drawn on the canvas last frame
+
+        VideoClip.__init__(self, make_frame=self.make_timeline_frame, duration=duration)
+        self.size = size
+
+    def active_index(self, t):
+        """Return the index of the clip playing at t, or None"""
+        if not self.intervals:
+            return None
+
+        # Fast path: same clip as last frame, or the one right after it
+        for index in (self.cursor, self.cursor + 1):
+            if index < len(self.intervals):
+                start, end, _ = self.intervals[index]
+                if start <= t < end:
+                    self.cursor = index
+                    return index
+
+        index = bisect.bisect_right(self.starts, t) - 1
+        if index >= 0 and t < self.intervals[index][1]:
+            self.cursor = index
+            return index
+        return None
+
+    def get_clip(self, index):
+        """Return the clip for an interval, opening lazy sources on demand"""
+        source = self.intervals[index][2]
+        if hasattr(source, 'get_frame'):
+            return source
+
+        if index in self.open_clips:
+            self.open_clips.move_to_end(index)
+            return self.open_clips[index]
+
+        clip = source()
+        self.open_clips[index] = clip
+        self.peak_open = max(self.peak_open, len(self.open_clips))
+
+        # Keep the window bounded, closing the least recently used clip
+        while len(self.open_clips) > self.max_open:
+            self.close_source(next(iter(self.open_clips)))
+        return clip
+
+    def close_finished(self, t):
+        """Close lazily opened clips whose interval has ended by t"""
+        for index in [i for i in self.open_clips if self.intervals[i][1] <= t]:
+            self.close_source(index)
+
+    def close_source(self, index):
+        clip = self.open_clips.pop(index, None)
+        if clip is not None:
+            clip.close()
+
+    def close(self):
+        for index in list(self.open_clips):
+            self.close_source(index)
+        VideoClip.close(self)
+
+    def clear_canvas(self):
+        if self.placed is not None:
+            y, x, h, w = self.placed
+            self.canvas[y:y + h, x:x + w] = self.bg_color
+            self.placed = None
+
+    def make_timeline_frame(self, t):
+        self.close_finished(t)
+        index = self.active_index(t)
+        if index is None:
+            self.clear_canvas()
+            return self.canvas
+
+        start = self.intervals[index][0]
+        clip = self.get_clip(index)
+        if clip is None:
+            # Source failed to open, show the background
+            self.clear_canvas()
+            return self.canvas
+
+        frame = clip.get_frame(t - start)
+        if clip.mask is not None:
+            # Blend over the background like CompositeVideoClip, not over black
+            mask = clip.mask.get_frame(t - start)[:, :, None]
+            frame = (mask * frame + (1.0 - mask) * np.array(self.bg_color)).astype(np.uint8)
+
+        canvas_h, canvas_w = self.canvas.shape[:2]
+        frame_h, frame_w = frame.shape[:2]
+
+        # Clip already covers the frame: no background needed
+        if (frame_h, frame_w) == (canvas_h, canvas_w):
+            return frame
+
+        # Center the clip, cropping anything that falls outside the canvas
+        x = (canvas_w - frame_w) // 2
+        y = (canvas_h - frame_h) // 2
+        src_x, src_y = max(0, -x), max(0, -y)
+        dst_x, dst_y = max(0, x), max(0, y)
+        w = min(frame_w - src_x, canvas_w - dst_x)
+        h = min(frame_h - src_y, canvas_h - dst_y)
+
+        placed = (dst_y, dst_x, h, w)
+        if placed != self.placed:
+            self.clear_canvas()
+            self.placed = placed
+
+        self.canvas[dst_y:dst_y + h, dst_x:dst_x + w] = frame[src_y:src_y + h, src_x:src_x + w]
+        return self.canvas
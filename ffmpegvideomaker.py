@@ -0,0 +1,129 @@
+import math
+import os
+import subprocess
+from moviepy.config import get_setting
+
+from textvideo import create_video_for_single_keyword
+
+
+def fit_filter(resolution=(1920, 1080), margin=40):
+    """ffmpeg filter chain matching create_clip: scale to height - margin, centered on black"""
+    width, height = resolution
+    return (
+        f"scale=-2:{height - margin},"
+        f"crop='min(iw,{width})':'min(ih,{height})',"
+        f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2:black,setsar=1"
+    )
+
+
+def frame_index(time_sec, fps):
+    """First output frame at or after time_sec (moviepy shows a clip for start <= t < end)"""
+    return max(0, math.ceil(time_sec * fps - 1e-6))
+
+
+def build_segments(adjusted_data, total_duration, fps=24):
+    """
+    Turn the adjusted keyword timeline into back to back segments.
+
+    Returns a list of (keyword or None, frame_count) tuples covering every output
+    frame. None marks a black gap where no clip is playing.
+    """
+    # Same frame count moviepy writes for the whole audio duration
+    total_frames = frame_index(total_duration, fps)
+    segments = []
+    cursor = 0
+
+    for keyword in adjusted_data:
+        start_frame = frame_index(keyword['start'] / 1000, fps)
+        end_frame = min(frame_index(keyword['end'] / 1000, fps), total_frames)
+        if end_frame <= start_frame or start_frame < cursor:
+            continue
+
+        if start_frame > cursor:
+            segments.append((None, start_frame - cursor))
+        segments.append((keyword, end_frame - start_frame))
+        cursor = end_frame
+
+    if cursor < total_frames:
+        segments.append((None, total_frames - cursor))
+
+    return segments
+
+
+def prepare_input(keyword, duration, resolution):
+    """Return the ffmpeg input arguments for a keyword, or None if its media is missing"""
+    path = keyword['path']
+
+    if keyword['type'] == 'text' and not os.path.exists(path):
+        # Text keywords may have been skipped by search_and_save_by_type
+        create_video_for_single_keyword(keyword['keyword'], path, resolution=resolution,
+                                        duration=duration, reveal_time=duration / 5)
+
+    if not os.path.exists(path):
+        print(f"Missing media for {keyword['type']} clip {keyword['order_id']}: {path}")
+        return None
+
+    if keyword['type'] == 'image':
+        return ['-loop', '1', '-t', f"{duration:.3f}", '-i', path]
+    if keyword['type'] == 'gif':
+        return ['-stream_loop', '-1', '-t', f"{duration:.3f}", '-i', path]
+    if keyword['type'] == 'text':
+        return ['-i', path]
+
+    print(f"Unknown type: {keyword['type']}")
+    return None
+
+
+def build_ffmpeg_command(adjusted_data, audio_path, output_path, total_duration,
+                         resolution=(1920, 1080), fps=24, margin=40):
+    """Compile the whole timeline into a single ffmpeg command with one filter_complex"""
+    width, height = resolution
+    inputs = []
+    filters = []
+    labels = []
+
+    for keyword, frames in build_segments(adjusted_data, total_duration, fps):
+        duration = frames / fps
+        input_args = prepare_input(keyword, duration, resolution) if keyword else None
+        index = len(labels)
+
+        if input_args is None:
+            # Black background where no clip is playing
+            inputs += ['-f', 'lavfi', '-t', f"{duration:.3f}", '-i', f"color=c=black:s={width}x{height}:r={fps}"]
+            chain = f"[{index}:v]setsar=1,format=yuv420p"
+        else:
+            inputs += input_args
+            # Same placement as create_clip
+            chain = (
+                f"[{index}:v]fps={fps},{fit_filter(resolution, margin)},format=yuv420p,"
+                # Hold the last frame when the source is shorter than its slot
+                f"tpad=stop_mode=clone:stop_duration={duration:.3f}"
+            )
+
+        filters.append(f"{chain},trim=end_frame={frames},setpts=PTS-STARTPTS[s{index}]")
+        labels.append(f"[s{index}]")
+
+    filters.append(f"{''.join(labels)}concat=n={len(labels)}:v=1:a=0[v]")
+
+    return [
+        get_setting("FFMPEG_BINARY"), '-y', '-loglevel', 'error',
+        *inputs,
+        '-i', audio_path,
+        '-filter_complex', ';'.join(filters),
+        '-map', '[v]', '-map', f"{len(labels)}:a",
+        '-r', str(fps),
+        '-c:v', 'libx264', '-preset', 'fast', '-crf', '28', '-pix_fmt', 'yuv420p',
+        '-c:a', 'aac',
+        output_path
+    ]
+
+
+def render_with_ffmpeg(adjusted_data, audio_path, output_path, total_duration,
+                       resolution=(1920, 1080), fps=24):
+    """Render the final video with a single ffmpeg process instead of CompositeVideoClip"""
+    command = build_ffmpeg_command(adjusted_data, audio_path, output_path, total_duration, resolution, fps)
+    print("Rendering final video with ffmpeg...")
+    result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed: {result.stderr.decode(errors='replace')}")
+    return output_path
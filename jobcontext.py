@@ -0,0 +1,66 @@
+import os
+
+
+class JobContext:
+    """
+    Workspace of a single video job.
+
+    Every stage reads and writes its files under root, so several jobs can run
+    side by side without sharing paths. DEFAULT_JOB keeps the original layout
+    (output/... and output_video.mp4 in the working directory).
+    """
+
+    def __init__(self, root="output", output_video_path=None):
+        self.root = root
+        self.output_video_path = output_video_path or os.path.join(root, "output_video.mp4")
+
+    def path(self, *parts):
+        return os.path.join(self.root, *parts)
+
+    @property
+    def summary_path(self):
+        return self.path("summary.txt")
+
+    @property
+    def script_path(self):
+        return self.path("script.txt")
+
+    @property
+    def audio_path(self):
+        return self.path("audio.mp3")
+
+    @property
+    def audio_chunks_path(self):
+        return self.path("audio_chunks.json")
+
+    @property
+    def transcript_path(self):
+        return self.path("transcript.json")
+
+    @property
+    def sentences_path(self):
+        return self.path("sentence_transcript_with_ids.json")
+
+    @property
+    def keywords_path(self):
+        return self.path("keywords.json")
+
+    @property
+    def mapped_path(self):
+        return self.path("mapped.json")
+
+    @property
+    def media_dir(self):
+        return self.path("media")
+
+    @property
+    def stage_cache_dir(self):
+        # Stage results stay inside the workspace, so jobs never restore each other's
+        return self.path("cache", "stages")
+
+    def media_path(self, entry_type, order_id, extension):
+        # Forward slashes keep mapped.json paths identical on every platform
+        return f"{self.media_dir}/{entry_type}/{order_id}.{extension}"
+
+
+DEFAULT_JOB = JobContext("output", output_video_path="output_video.mp4")
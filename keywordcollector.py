@@ -3,7 +3,10 @@ import json
 import re
 from dotenv import load_dotenv
 import os
-import time
+
+from jobcontext import DEFAULT_JOB
+from llmcache import cached_generate
+from ratelimit import call_with_retry
 
 # Load environment variables
 load_dotenv()
@@ -33,18 +36,7 @@ def extract_json_from_response(response_text):
         print(f"Error extracting JSON: {e}")
         return []
 
-def get_keywords_from_gemini(text):
-    """
-    Generates keywords for a given sentence using the Google Gemini API.
-    Prioritizes types in the order: image > gif > text.
-    Ensures each keyword appears only once with a single type.
-    Returns a list of keywords with order_id, type, and keyword.
-    """
-    try:
-        # System instruction for Gemini AI
-        instruction = """
-    You are tasked with processing a sentence and extracting relevant keywords for video content. Each keyword should be assigned an order ID based on its position in the sentence, and you must determine whether it should be represented as text, image, or gif in the video.
-
+KEYWORD_RULES = """
     Rules:
     1. Extract meaningful and relevant keywords from the sentence **in the order they appear**.
     2. Assign 'image' for specific objects, products, visual concepts, or abstract ideas (e.g., "success" ➔ trophy image, "team" ➔ group illustration).
@@ -54,7 +46,12 @@ def get_keywords_from_gemini(text):
     6. Ensure each keyword appears only once with a single type.
     7. Prioritize assigning "image" or "gif" over "text" where possible to ensure a balanced distribution of types.
     8. Avoid assigning the same type to more than two consecutive keywords. If necessary, re-evaluate the type assignment to ensure diversity.
+"""
 
+# System instruction for Gemini AI, one sentence per request
+KEYWORD_INSTRUCTION = """
+    You are tasked with processing a sentence and extracting relevant keywords for video content. Each keyword should be assigned an order ID based on its position in the sentence, and you must determine whether it should be represented as text, image, or gif in the video.
+""" + KEYWORD_RULES + """
     Output Format:
     [
         {"order_id": 1, "type": "image", "keyword": "example keyword"},
@@ -63,75 +60,204 @@ def get_keywords_from_gemini(text):
     ]
     """
 
-        # Combine instruction and input text
-        prompt = instruction + "\n\nInput Sentence:\n" + text
+# Same rules for several sentences at once, answered per sentence id
+BATCH_KEYWORD_INSTRUCTION = """
+    You are tasked with processing a list of sentences and extracting relevant keywords for video content from each sentence separately. Each sentence has an id. For every sentence, each keyword should be assigned an order ID based on its position in that sentence, and you must determine whether it should be represented as text, image, or gif in the video.
+""" + KEYWORD_RULES + """
+    Apply the rules to every sentence on its own and answer for every id, in the same order as the input.
+
+    Output Format:
+    [
+        {"id": 1, "keywords": [
+            {"order_id": 1, "type": "image", "keyword": "example keyword"},
+            {"order_id": 2, "type": "gif", "keyword": "example keyword"}
+        ]},
+        {"id": 2, "keywords": [
+            {"order_id": 1, "type": "text", "keyword": "example keyword"}
+        ]}
+    ]
+    """
 
-        # Initialize the Gemini model
-        model = genai.GenerativeModel("gemini-1.5-flash")
+# Sentences per batched request. Batches are also kept within the model's
+# output budget below, since the answer grows with every sentence.
+KEYWORD_BATCH_SIZE = 20
+MODEL_OUTPUT_TOKENS = 8192      # gemini-1.5-flash output limit
+OUTPUT_TOKENS_PER_WORD = 20     # rough cost of one keyword entry in the answer
 
-        # Configure safety settings to allow all content
-        safety_settings = [
-            {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_NONE"},
-            {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_NONE"},
-            {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_NONE"},
-            {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_NONE"}
-        ]
 
-        # Generate content with safety settings
-        response = model.generate_content(prompt, safety_settings=safety_settings)
+def generate_keyword_response(prompt, use_cache=True):
+    """
+    Send a keyword prompt to Gemini and return the response text. Answers are
+    read through the LLM cache, use_cache=False asks the model again.
+    """
+    # Initialize the Gemini model
+    model_name = "gemini-1.5-flash"
+    model = genai.GenerativeModel(model_name)
+
+    # Configure safety settings to allow all content
+    safety_settings = [
+        {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_NONE"},
+        {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_NONE"},
+        {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_NONE"},
+        {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_NONE"}
+    ]
+
+    def generate():
+        # Generate content with safety settings, within the shared Gemini rate limit
+        response = call_with_retry("gemini", model.generate_content, prompt, safety_settings=safety_settings)
 
         # Extract the text from the response
-        response_text = response.text
+        return response.text
 
-        # Extract valid JSON from the response
-        keywords_output = extract_json_from_response(response_text)
+    return cached_generate(model_name, prompt, generate, safety_settings=safety_settings, use_cache=use_cache)
 
-        # Deduplicate keywords and prioritize types
-        deduplicated_keywords = []
-        seen_keywords = set()
 
-        for keyword in keywords_output:
-            keyword_text = keyword["keyword"]
-            if keyword_text not in seen_keywords:
-                # Prioritize types: image > gif > text
-                if keyword["type"] == "image":
-                    deduplicated_keywords.append(keyword)
-                elif keyword["type"] == "gif" and not any(k["keyword"] == keyword_text and k["type"] == "image" for k in deduplicated_keywords):
-                    deduplicated_keywords.append(keyword)
-                elif keyword["type"] == "text" and not any(k["keyword"] == keyword_text and k["type"] in ["image", "gif"] for k in deduplicated_keywords):
-                    deduplicated_keywords.append(keyword)
+def deduplicate_keywords(keywords_output):
+    """Keep each keyword once, preferring image > gif > text"""
+    deduplicated_keywords = []
+    seen_keywords = set()
+
+    for keyword in keywords_output:
+        keyword_text = keyword["keyword"]
+        if keyword_text not in seen_keywords:
+            # Prioritize types: image > gif > text
+            if keyword["type"] == "image":
+                deduplicated_keywords.append(keyword)
+            elif keyword["type"] == "gif" and not any(k["keyword"] == keyword_text and k["type"] == "image" for k in deduplicated_keywords):
+                deduplicated_keywords.append(keyword)
+            elif keyword["type"] == "text" and not any(k["keyword"] == keyword_text and k["type"] in ["image", "gif"] for k in deduplicated_keywords):
+                deduplicated_keywords.append(keyword)
 
-                seen_keywords.add(keyword_text)
+            seen_keywords.add(keyword_text)
 
-        return deduplicated_keywords
+    return deduplicated_keywords
+
+
+def get_keywords_from_gemini(text, use_cache=True):
+    """
+    Generates keywords for a given sentence using the Google Gemini API.
+    Prioritizes types in the order: image > gif > text.
+    Ensures each keyword appears only once with a single type.
+    Returns a list of keywords with order_id, type, and keyword.
+    Re-runs are answered from the LLM cache unless use_cache is False.
+    """
+    try:
+        # Combine instruction and input text
+        prompt = KEYWORD_INSTRUCTION + "\n\nInput Sentence:\n" + text
+
+        # Extract valid JSON from the response
+        keywords_output = extract_json_from_response(generate_keyword_response(prompt, use_cache))
+
+        # Deduplicate keywords and prioritize types
+        return deduplicate_keywords(keywords_output)
 
     except Exception as e:
         print(f"Error processing Gemini AI response: {e}")
         return []
 
 
-# Function 1: Process JSON file and generate keywords
-def process_json_file(json_file_path):
+def valid_keywords(keywords):
+    return isinstance(keywords, list) and all(
+        isinstance(k, dict) and isinstance(k.get("keyword"), str) and k.get("type") in ("image", "gif", "text")
+        for k in keywords
+    )
+
+
+def get_keywords_for_batch(sentences, use_cache=True):
     """
-    Reads the JSON file, processes each sentence, and generates keywords using the Gemini API.
-    If no keywords are generated for a sentence, the entire sentence text is used as a keyword with type 'text'.
-    Saves the results to a keywords.json file.
+    Generates keywords for several sentences in one Gemini request.
+
+    Sentences are sent with their ids and the answer is split back per id.
+    Returns {id: keywords} holding only the sentences whose keywords parsed;
+    the caller retries the missing ones individually.
     """
-    # Load the JSON file
-    with open(json_file_path, 'r') as file:
-        data = json.load(file)
+    items = [{"id": sentence["id"], "sentence": sentence["sentence"]} for sentence in sentences]
+    try:
+        prompt = BATCH_KEYWORD_INSTRUCTION + "\n\nInput Sentences:\n" + json.dumps(items, ensure_ascii=False)
+        batch_output = extract_json_from_response(generate_keyword_response(prompt, use_cache))
+    except Exception as e:
+        print(f"Error processing batched Gemini AI response: {e}")
+        return {}
 
-    # Initialize an empty list to store the results
-    results = []
+    expected = {item["id"] for item in items}
+    results = {}
+    for entry in batch_output:
+        if not isinstance(entry, dict) or entry.get("id") not in expected:
+            continue
+        keywords = entry.get("keywords")
+        if valid_keywords(keywords) and keywords:
+            results[entry["id"]] = deduplicate_keywords(keywords)
+    return results
+
+
+def plan_batches(sentences, batch_size=KEYWORD_BATCH_SIZE, output_tokens=MODEL_OUTPUT_TOKENS):
+    """
+    Splits sentences into batches of at most batch_size, closing a batch early
+    when its expected answer would use more than half of the model's output
+    tokens. The input side is never the limit with a 1M token context window.
+
+    sentences can be any iterable, e.g. iter_sentences over a live transcript;
+    each batch is yielded as soon as it is complete.
+    """
+    batch = []
+    budget = 0
+    for sentence in sentences:
+        cost = OUTPUT_TOKENS_PER_WORD * len(sentence["sentence"].split())
+        if batch and budget + cost > output_tokens // 2:
+            yield batch
+            batch = []
+            budget = 0
+        batch.append(sentence)
+        budget += cost
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+            budget = 0
+    if batch:
+        yield batch
+
+
+def iter_batch_keywords(sentences, batch_size, use_cache=True):
+    """Yields (sentence, keywords) batch by batch, retrying unparsed sentences on their own"""
+    # Fall back to positions for sentence files without ids
+    sentences = (dict(sentence, id=sentence.get("id", index)) for index, sentence in enumerate(sentences, start=1))
+
+    for batch in plan_batches(sentences, batch_size):
+        batch_keywords = get_keywords_for_batch(batch, use_cache) if len(batch) > 1 else {}
+        missing = sum(1 for sentence in batch if sentence["id"] not in batch_keywords)
+        if len(batch) > 1:
+            print(f"Batch of {len(batch)} sentences done, {missing} retried individually")
+        for sentence in batch:
+            keywords = batch_keywords.get(sentence["id"])
+            if keywords is None:
+                keywords = get_keywords_from_gemini(sentence["sentence"], use_cache)
+            yield sentence, keywords
+
+
+def iter_sentence_keywords(sentences, batch_size=KEYWORD_BATCH_SIZE, use_cache=True):
+    """
+    Generates keywords sentence by sentence, yielding (sentence, keywords) as soon as
+    each sentence is done so later stages can start before the whole script is processed.
+    order_id is assigned globally across all sentences.
+
+    Up to batch_size sentences share one Gemini request; batch_size=1 sends
+    one request per sentence.
+    """
     global_order_id = 1  # Track order_id globally across all sentences
 
+    if batch_size > 1:
+        extracted = iter_batch_keywords(sentences, batch_size, use_cache)
+    else:
+        extracted = ((sentence, None) for sentence in sentences)
+
     # Loop through each sentence in the JSON
-    for sentence in data:
+    for sentence, keywords in extracted:
         text = sentence["sentence"]
 
         # Get keywords from the Gemini API
         try:
-            keywords = get_keywords_from_gemini(text)
+            if keywords is None:
+                keywords = get_keywords_from_gemini(text, use_cache)
 
             # If no keywords are generated, use the entire sentence text as a keyword with type 'text'
             if not keywords:
@@ -141,30 +267,51 @@ def process_json_file(json_file_path):
                 ]
                 global_order_id += 1
 
-            # Update order_id for each keyword and add to results
+            # Update order_id for each keyword
             for keyword in keywords:
                 keyword["order_id"] = global_order_id
-                results.append(keyword)
                 global_order_id += 1
 
             print("done!")
 
-            # Add a delay to avoid hitting API rate limits
-            time.sleep(1)  # Adjust the delay as needed
-
         except Exception as e:
             print(f"Error processing sentence: {text}: {e}")
             # If an error occurs, use the entire sentence text as a keyword with type 'text'
-            results.append({
+            keywords = [{
                 "order_id": global_order_id,
                 "type": "text",
                 "keyword": text
-            })
+            }]
             global_order_id += 1
-            continue
+
+        # Lets global alignment band each keyword to its sentence
+        for keyword in keywords:
+            keyword["sentence_id"] = sentence.get("id")
+
+        yield sentence, keywords
+
+
+# Function 1: Process JSON file and generate keywords
+def process_json_file(json_file_path, job=None, batch_size=KEYWORD_BATCH_SIZE, use_cache=True):
+    """
+    Reads the JSON file, processes each sentence, and generates keywords using the Gemini API.
+    If no keywords are generated for a sentence, the entire sentence text is used as a keyword with type 'text'.
+    Saves the results to the job's keywords.json file. batch_size sentences
+    are sent per Gemini request; use_cache=False bypasses the LLM response cache.
+    """
+    job = job or DEFAULT_JOB
+
+    # Load the JSON file
+    with open(json_file_path, 'r') as file:
+        data = json.load(file)
+
+    # Initialize an empty list to store the results
+    results = []
+    for _, keywords in iter_sentence_keywords(data, batch_size, use_cache):
+        results.extend(keywords)
 
     # Save the results to a keywords.json file
-    with open("output/keywords.json", "w") as output_file:
+    with open(job.keywords_path, "w") as output_file:
         json.dump(results, output_file, indent=4)
 
-    print("Keywords saved to keywords.json")
+    print("Keywords saved to keywords.json")
\ No newline at end of file
@@ -0,0 +1,103 @@
+import hashlib
+import json
+import time
+import zlib
+
+from sqlitecache import SqliteLRUCache, get_cache
+
+LLM_CACHE_DIR = "output/cache/llm"
+LLM_CACHE_TTL = 90 * 24 * 3600         # seconds before a response is requested again
+LLM_CACHE_MAX_BYTES = 256 * 1024 ** 2  # size budget for the compressed responses
+
+
+def request_key(model_name, prompt, safety_settings=None, generation_config=None):
+    """sha256 over everything that changes the model's answer"""
+    request = {
+        "model": model_name,
+        "prompt": prompt,
+        "safety_settings": safety_settings,
+        "generation_config": generation_config,
+    }
+    return hashlib.sha256(json.dumps(request, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class LLMCache(SqliteLRUCache):
+    """
+    On-disk cache of LLM response texts keyed by request_key.
+
+    Responses are zlib compressed in a single sqlite database. Entries expire
+    after ttl seconds, and the least recently used ones are evicted once the
+    compressed responses exceed max_bytes.
+    """
+
+    def __init__(self, root=LLM_CACHE_DIR, ttl=LLM_CACHE_TTL, max_bytes=LLM_CACHE_MAX_BYTES):
+        super().__init__(root, "responses.db", [
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, model TEXT, response BLOB, size INTEGER, created REAL, last_used REAL)"
+        ], ttl, max_bytes)
+
+    def get(self, key):
+        """Cached response text for key, or None"""
+        now = time.time()
+        with self.connect() as db:
+            row = db.execute("SELECT response, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None and self.expired(row[1], now):
+                db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                row = None
+            if row is None:
+                self.count(db, "misses")
+                return None
+            db.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+            self.count(db, "hits")
+        return zlib.decompress(row[0]).decode("utf-8")
+
+    def put(self, key, model_name, response_text):
+        data = zlib.compress(response_text.encode("utf-8"), 9)
+        now = time.time()
+        with self.connect() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model_name, data, len(data), now, now)
+            )
+        self.evict()
+
+    def lru_units(self, db):
+        return db.execute("SELECT key, size FROM responses ORDER BY last_used").fetchall()
+
+    def drop_unit(self, db, key):
+        db.execute("DELETE FROM responses WHERE key = ?", (key,))
+
+    def usage(self, db):
+        return db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+
+
+def get_llm_cache():
+    """Process wide LLMCache, or None when disabled with LLM_CACHE=off"""
+    return get_cache(LLMCache, "LLM", LLM_CACHE_DIR, LLM_CACHE_TTL, LLM_CACHE_MAX_BYTES)
+
+
+def cached_generate(model_name, prompt, generate, safety_settings=None, generation_config=None, use_cache=True):
+    """
+    Read-through cache around an LLM call. generate() is only called on a miss
+    and must return the response text; empty responses are not cached.
+    use_cache=False always calls the model and refreshes the cached entry.
+    """
+    cache = get_llm_cache()
+    if cache is None:
+        return generate()
+
+    key = request_key(model_name, prompt, safety_settings, generation_config)
+    if use_cache:
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+
+    response_text = generate()
+    if response_text:
+        cache.put(key, model_name, response_text)
+    return response_text
+
+
+if __name__ == "__main__":
+    cache = get_llm_cache()
+    print(cache.stats() if cache else "LLM_CACHE is off")
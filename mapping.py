@@ -1,4 +1,10 @@
 import json
+import os
+from bisect import bisect_left, bisect_right
+
+import numpy as np
+
+from jobcontext import DEFAULT_JOB
 
 def clean_word(word):
     return word.lower().rstrip('.,?!:;\'\"').strip()
@@ -13,70 +19,360 @@ def words_match(word1, word2):
         return True
     return False
 
-def find_phrase_timestamps(phrase, words_list, last_end_time=0, used_timestamps=None):
-    if used_timestamps is None:
-        used_timestamps = set()
+class WordTable:
+    """
+    Transcript words cleaned once into parallel lists, with a prefix index.
+
+    words, starts and ends mirror words_list by position. prefixes maps every
+    prefix of a cleaned word to the sorted positions of the words starting with
+    it, and exact maps each cleaned word to its positions, so the words matching
+    a phrase word are looked up instead of scanned for.
+    """
+
+    def __init__(self, words_list):
+        # words_match cleans the already cleaned word a second time
+        self.words = [clean_word(clean_word(entry['word'])) for entry in words_list]
+        self.starts = [entry['start'] for entry in words_list]
+        self.ends = [entry['end'] for entry in words_list]
+        self.timestamps = list(zip(self.starts, self.ends))
+        self.ordered = all(a <= b for a, b in zip(self.starts, self.starts[1:]))
+
+        self.exact = {}
+        self.prefixes = {}
+        for pos, word in enumerate(self.words):
+            self.exact.setdefault(word, []).append(pos)
+            for n in range(len(word) + 1):
+                self.prefixes.setdefault(word[:n], []).append(pos)
+        self._matches = {}
+
+    def matching(self, phrase_word):
+        """Sorted positions of the words that words_match phrase_word"""
+        positions = self._matches.get(phrase_word)
+        if positions is None:
+            # Words starting with phrase_word, plus words phrase_word starts with
+            found = set(self.prefixes.get(phrase_word, ()))
+            for n in range(len(phrase_word)):
+                found.update(self.exact.get(phrase_word[:n], ()))
+            positions = self._matches[phrase_word] = sorted(found)
+        return positions
+
+    def next_unused(self, phrase_word, pos, used_timestamps):
+        """First position >= pos matching phrase_word whose timestamp is unused, or None"""
+        positions = self.matching(phrase_word)
+        for k in range(bisect_left(positions, pos), len(positions)):
+            if self.timestamps[positions[k]] not in used_timestamps:
+                return positions[k]
+        return None
+
+    def find(self, phrase, last_end_time=0, used_timestamps=None):
+        """
+        Earliest unused occurrence of phrase starting after last_end_time, as
+        (start, end, matched_positions), or (0, 0, set()) if there is none.
+
+        The phrase words after the first are matched greedily in order, skipping
+        used words in between. Candidates are visited from a cursor at
+        last_end_time and the search stops at the first valid match: if the
+        rest of the phrase cannot be found after one candidate it cannot be
+        found after any later one either.
+        """
+        if used_timestamps is None:
+            used_timestamps = set()
+
+        phrase_words = [clean_word(word) for word in phrase.lower().split()]
+        candidates = self.matching(phrase_words[0])
+        if self.ordered:
+            cursor = bisect_left(candidates, bisect_right(self.starts, last_end_time))
+        else:
+            cursor = 0
+
+        matches = []
+        for pos in candidates[cursor:]:
+            start = self.starts[pos]
+            if start <= last_end_time or self.timestamps[pos] in used_timestamps:
+                continue
+            if self.ordered and matches and start != matches[0][0]:
+                # Only candidates tied on start can still sort before the first match
+                break
+
+            matched_positions = {pos}
+            phrase_end = self.ends[pos]
+            search_pos = pos + 1
+            for phrase_word in phrase_words[1:]:
+                found = self.next_unused(phrase_word, search_pos, used_timestamps)
+                if found is None:
+                    break
+                matched_positions.add(found)
+                phrase_end = self.ends[found]
+                search_pos = found + 1
+            else:
+                matches.append((start, phrase_end, matched_positions))
+                continue
+            break
+
+        if matches:
+            matches.sort()
+            return matches[0][0], matches[0][1], matches[0][2]
+        return (0, 0, set())
+
+
+def find_phrase_timestamps(phrase, words_list, last_end_time=0, used_timestamps=None, table=None):
+    """
+    Earliest unused occurrence of phrase in words_list after last_end_time.
+    Pass a WordTable built once for words_list when mapping many phrases.
+    """
+    if table is None:
+        table = WordTable(words_list)
+    return table.find(phrase, last_end_time, used_timestamps)
+
+class KeywordMapper:
+    """
+    Greedy keyword to timestamp mapper that can be fed one keyword at a time.
+
+    Keeps the words already used and the end of the last match between calls, so
+    keywords can be mapped as soon as they are extracted. Call finalize() once
+    every keyword has been added to apply the post-processing adjustments.
+    """
+
+    def __init__(self, words_list, job=None):
+        self.words_list = words_list
+        self.table = WordTable(words_list)
+        self.job = job or DEFAULT_JOB
+        self.used_timestamps = set()
+        self.last_end_time = -1  # Initialize to -1 to find earliest matches
+        self.combined_data = []
+
+    def find_phrase(self, keyword):
+        return find_phrase_timestamps(
+            keyword, 
+            self.words_list, 
+            self.last_end_time,
+            self.used_timestamps,
+            self.table
+        )
+
+    def add(self, keyword_entry):
+        """Map a keyword entry, returning the combined entry or None if it was not found"""
+        keyword = keyword_entry['keyword']
+        
+        start_time, end_time, matched_positions = self.find_phrase(keyword)
+        
+        # Only add entries with valid timestamps (start >= 0 and end > 0)
+        if not (start_time >= 0 and end_time > 0):
+            return None
+
+        for pos in matched_positions:
+            word_entry = self.words_list[pos]
+            self.used_timestamps.add((word_entry['start'], word_entry['end']))
         
-    phrase_words = phrase.lower().split()
-    
-    cleaned_words = [
-        {
-            'word': clean_word(entry['word']),
-            'start': entry['start'],
-            'end': entry['end']
+        self.last_end_time = end_time
+        return self.record(keyword_entry, start_time, end_time)
+
+    def record(self, keyword_entry, start_time, end_time):
+        """Append the combined entry for a keyword mapped to start_time..end_time"""
+        order_id = keyword_entry['order_id']
+        entry_type = keyword_entry['type']
+        keyword = keyword_entry['keyword']
+
+        # Generate path
+        media_types = {
+            'text': 'text',
+            'gif': 'mp4',
+            'image': 'jpg'
         }
-        for entry in words_list
-    ]
-    
-    matches = []
-    i = 0
-    while i < len(cleaned_words):
-        current_word = cleaned_words[i]
+        media_type = media_types.get(entry_type, 'other')
+        path = self.job.media_path(entry_type, order_id, media_type if media_type != 'text' else 'mp4')
         
-        if current_word['start'] <= last_end_time:
-            i += 1
-            continue
-            
-        if words_match(current_word['word'], phrase_words[0]):
-            match_found = True
-            phrase_start = current_word['start']
-            phrase_end = current_word['end']
-            matched_positions = set([i])
-            
-            if len(phrase_words) > 1:
-                remaining_words = phrase_words[1:]
-                search_pos = i + 1
-                
-                for phrase_word in remaining_words:
-                    word_found = False
-                    while search_pos < len(cleaned_words):
-                        if (cleaned_words[search_pos]['start'], cleaned_words[search_pos]['end']) not in used_timestamps:
-                            if words_match(cleaned_words[search_pos]['word'], phrase_word):
-                                phrase_end = cleaned_words[search_pos]['end']
-                                matched_positions.add(search_pos)
-                                word_found = True
-                                search_pos += 1
-                                break
-                        search_pos += 1
-                    if not word_found:
-                        match_found = False
-                        break
+        combined_entry = {
+            "order_id": order_id,
+            "type": entry_type,
+            "keyword": keyword,
+            "start": start_time,
+            "end": end_time,
+            "path": path
+        }
+        
+        self.combined_data.append(combined_entry)
+        return combined_entry
+
+    def finalize(self):
+        """Apply the post-processing adjustments and return all mapped entries"""
+        combined_data = self.combined_data
+        if combined_data:
+            # Force first entry to start at 0
+            combined_data[0]['start'] = 0
             
-            if match_found:
-                timestamp_used = any(
-                    (cleaned_words[pos]['start'], cleaned_words[pos]['end']) in used_timestamps 
-                    for pos in matched_positions
-                )
-                if not timestamp_used:
-                    matches.append((phrase_start, phrase_end, matched_positions))
-        i += 1
-    
-    if matches:
-        matches.sort()
-        return matches[0][0], matches[0][1], matches[0][2]
-    return (0, 0, set())
+            # Adjust end times to be 1ms before next start
+            for i in range(len(combined_data) - 1):
+                combined_data[i]['end'] = combined_data[i+1]['start'] - 1
+        return combined_data
+
+# Words on either side of a keyword's sentence that global alignment may still use
+BAND_SLACK_WORDS = 24
+# Band half width in words when keywords carry no sentence ids
+BAND_WIDTH_WORDS = 400
+
+_NEG = -(1 << 30)
+
+
+def alignment_bands(tokens, table, sentences=None):
+    """
+    Word window [lo, hi) for every keyword token, kept monotonic and overlapping
+    so the banded alignment stays connected.
+
+    Tokens of keywords with a sentence_id are limited to their sentence's time
+    window plus BAND_SLACK_WORDS, others to a diagonal band around their
+    proportional position in the transcript.
+    """
+    word_count = len(table.words)
+    windows = {}
+    if sentences and table.ordered:
+        for sentence in sentences:
+            if sentence.get('start') is None or sentence.get('end') is None:
+                continue
+            lo = bisect_left(table.starts, sentence['start']) - BAND_SLACK_WORDS
+            hi = bisect_right(table.starts, sentence['end']) + BAND_SLACK_WORDS
+            windows[sentence.get('id')] = (max(0, lo), min(word_count, hi))
 
-def map_keywords_and_timestamps(keywords_file_path, timestamps_file_path, output_file_path):
+    lo = np.empty(len(tokens), dtype=np.int64)
+    hi = np.empty(len(tokens), dtype=np.int64)
+    for i, (_, _, sentence_id) in enumerate(tokens):
+        window = windows.get(sentence_id)
+        if window is None:
+            center = i * word_count // len(tokens)
+            window = (max(0, center - BAND_WIDTH_WORDS), min(word_count, center + BAND_WIDTH_WORDS))
+        lo[i], hi[i] = window
+
+    lo = np.maximum.accumulate(lo)
+    hi = np.maximum.accumulate(np.maximum(hi, lo + 1))
+    # Each row must share a column with the previous one
+    lo[1:] = np.minimum(lo[1:], hi[:-1] - 1)
+    return lo, hi
+
+
+def align_tokens(tokens, table, sentences=None):
+    """
+    Banded LCS alignment of keyword tokens against the word table. Returns the
+    (token index, word position) pairs of the matched tokens, in reverse order.
+    """
+    pairs = []
+    if not tokens or not table.words:
+        return pairs
+
+    lo, hi = alignment_bands(tokens, table, sentences)
+    match_positions = {}
+    directions = []
+
+    prev = None
+    prev_lo = prev_hi = 0
+    for i, (_, token, _) in enumerate(tokens):
+        row_lo, row_hi = int(lo[i]), int(hi[i])
+        width = row_hi - row_lo
+
+        positions = match_positions.get(token)
+        if positions is None:
+            positions = match_positions[token] = np.array(table.matching(token), dtype=np.int64)
+        match = np.zeros(width, dtype=np.int64)
+        window = positions[np.searchsorted(positions, row_lo):np.searchsorted(positions, row_hi)]
+        match[window - row_lo] = 1
+
+        # Scores of the previous row at columns j (up) and j - 1 (diagonal)
+        if prev is None:
+            up = np.zeros(width, dtype=np.int64)
+            diag = np.zeros(width, dtype=np.int64)
+        else:
+            up = np.full(width, _NEG, dtype=np.int64)
+            a, b = max(row_lo, prev_lo), min(row_hi, prev_hi)
+            if a < b:
+                up[a - row_lo:b - row_lo] = prev[a - prev_lo:b - prev_lo]
+            diag = np.full(width, _NEG, dtype=np.int64)
+            a, b = max(row_lo, prev_lo + 1), min(row_hi, prev_hi + 1)
+            if a < b:
+                diag[a - row_lo:b - row_lo] = prev[a - 1 - prev_lo:b - 1 - prev_lo]
+            if row_lo == 0:
+                # Column 0 matches after skipping every earlier token
+                diag[0] = 0
+
+        # score[j] = max(diag + match, up, score[j - 1])
+        score = np.maximum.accumulate(np.maximum(diag + match, up))
+
+        # Traceback, preferring to skip words so tokens land on their earliest match:
+        # 0 up (skip token), 1 left (skip word), 2 diagonal match, 3 diagonal skip
+        step = np.full(width, 3, dtype=np.uint8)
+        step[score == up] = 0
+        step[(match == 1) & (score == diag + 1)] = 2
+        left = np.zeros(width, dtype=bool)
+        left[1:] = score[1:] == score[:-1]
+        step[left] = 1
+        directions.append(step)
+
+        prev, prev_lo, prev_hi = score, row_lo, row_hi
+
+    i, j = len(tokens) - 1, prev_hi - 1
+    # Past column 0 the remaining tokens are unmatched
+    while i >= 0 and j >= 0:
+        step = directions[i][j - int(lo[i])]
+        if step == 1:
+            j -= 1
+            continue
+        if step == 2:
+            pairs.append((i, j))
+        if step >= 2:
+            j -= 1
+        i -= 1
+
+    return pairs
+
+
+def align_keywords(keywords_data, words_list, sentences=None, job=None):
+    """
+    Global keyword alignment: the whole ordered keyword sequence is aligned to
+    the transcript in one dynamic programming pass.
+
+    Every keyword word is a token, and the alignment maximizes the number of
+    tokens matched to transcript words (words_match semantics) while keeping
+    both sequences in order, so one keyword that cannot be found no longer
+    pulls the following ones away from their place. Rows are banded by the
+    keywords' sentence windows and computed with NumPy; only a uint8 traceback
+    band is kept per token, so memory grows with the band, not with
+    keywords x words.
+
+    A keyword is mapped from its first to its last matched word. Keywords with no
+    matched word are reported and left out. Returns the finalized entries.
+    """
+    mapper = KeywordMapper(words_list, job)
+    table = mapper.table
+
+    tokens = []  # (keyword index, cleaned word, sentence id)
+    for k, keyword_entry in enumerate(keywords_data):
+        for word in keyword_entry['keyword'].lower().split():
+            tokens.append((k, clean_word(word), keyword_entry.get('sentence_id')))
+
+    matched = {}  # keyword index -> matched word positions
+    for i, pos in align_tokens(tokens, table, sentences):
+        matched.setdefault(tokens[i][0], []).append(pos)
+
+    for k, keyword_entry in enumerate(keywords_data):
+        positions = matched.get(k)
+        if not positions:
+            print(f"No match for keyword '{keyword_entry['keyword']}'")
+            continue
+        start_time = table.starts[min(positions)]
+        end_time = table.ends[max(positions)]
+        # Same validity rule as the greedy mapper
+        if start_time >= 0 and end_time > 0:
+            mapper.record(keyword_entry, start_time, end_time)
+
+    return mapper.finalize()
+
+
+def map_keywords_and_timestamps(keywords_file_path, timestamps_file_path, output_file_path, job=None,
+                                mode="greedy", sentences_file_path=None):
+    """
+    Map keywords.json onto the transcript and write mapped.json.
+
+    mode="greedy" places keywords one at a time; mode="global" aligns them all
+    at once with align_keywords, banded by the sentences file when given.
+    """
     with open(keywords_file_path, 'r') as f:
         keywords_data = json.load(f)
     
@@ -85,62 +381,23 @@ def map_keywords_and_timestamps(keywords_file_path, timestamps_file_path, output
     
     words_list = timestamps_data.get('words', [])
     
-    used_timestamps = set()
-    last_end_time = -1  # Initialize to -1 to find earliest matches
-    
-    combined_data = []
-    
-    for keyword_entry in keywords_data:
-        order_id = keyword_entry['order_id']
-        entry_type = keyword_entry['type']
-        keyword = keyword_entry['keyword']
-        
-        start_time, end_time, matched_positions = find_phrase_timestamps(
-            keyword, 
-            words_list, 
-            last_end_time,
-            used_timestamps
-        )
-        
-        # Only add entries with valid timestamps (start >= 0 and end > 0)
-        if start_time >= 0 and end_time > 0:
-            for pos in matched_positions:
-                word_entry = words_list[pos]
-                used_timestamps.add((word_entry['start'], word_entry['end']))
-            
-            last_end_time = end_time
-            
-            # Generate path
-            media_types = {
-                'text': 'text',
-                'gif': 'mp4',
-                'image': 'jpg'
-            }
-            media_type = media_types.get(entry_type, 'other')
-            path = f"output/media/{entry_type}/{order_id}.{media_type if media_type != 'text' else 'mp4'}"
-            
-            combined_entry = {
-                "order_id": order_id,
-                "type": entry_type,
-                "keyword": keyword,
-                "start": start_time,
-                "end": end_time,
-                "path": path
-            }
-            
-            combined_data.append(combined_entry)
-    
-    # Post-processing adjustments
-    if combined_data:
-        # Force first entry to start at 0
-        combined_data[0]['start'] = 0
-        
-        # Adjust end times to be 1ms before next start
-        for i in range(len(combined_data) - 1):
-            combined_data[i]['end'] = combined_data[i+1]['start'] - 1
+    if mode == "global":
+        sentences = None
+        if sentences_file_path and os.path.exists(sentences_file_path):
+            with open(sentences_file_path, 'r') as f:
+                sentences = json.load(f)
+        combined_data = align_keywords(keywords_data, words_list, sentences, job)
+    elif mode == "greedy":
+        mapper = KeywordMapper(words_list, job)
+        for keyword_entry in keywords_data:
+            mapper.add(keyword_entry)
+
+        # Post-processing adjustments
+        combined_data = mapper.finalize()
+    else:
+        raise ValueError(f"Unknown mapping mode: {mode}")
     
     with open(output_file_path, 'w') as f:
         json.dump(combined_data, f, indent=2)
     
     return combined_data
-
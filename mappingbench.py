@@ -0,0 +1,192 @@
+import random
+import time
+
+from mapping import KeywordMapper, WordTable, align_tokens, clean_word, words_match
+
+# Benchmark and equivalence check for keyword mapping. The scan below is the
+# previous find_phrase_timestamps, kept as the reference the WordTable must match;
+# the global alignment is checked against a plain quadratic LCS.
+#
+#   python mappingbench.py
+
+VOCABULARY = [
+    "run", "running", "runner", "the", "then", "there", "code", "coder", "coding",
+    "javascript", "java", "script", "framework", "frame", "ai", "air", "a", "fast",
+    "faster", "data", "database", "bug", "bugs", "deploy", "deployed", "cloud",
+]
+
+
+def scan_phrase_timestamps(phrase, words_list, last_end_time=0, used_timestamps=None):
+    if used_timestamps is None:
+        used_timestamps = set()
+
+    phrase_words = phrase.lower().split()
+
+    cleaned_words = [
+        {
+            'word': clean_word(entry['word']),
+            'start': entry['start'],
+            'end': entry['end']
+        }
+        for entry in words_list
+    ]
+
+    matches = []
+    i = 0
+    while i < len(cleaned_words):
+        current_word = cleaned_words[i]
+
+        if current_word['start'] <= last_end_time:
+            i += 1
+            continue
+
+        if words_match(current_word['word'], phrase_words[0]):
+            match_found = True
+            phrase_start = current_word['start']
+            phrase_end = current_word['end']
+            matched_positions = set([i])
+
+            if len(phrase_words) > 1:
+                remaining_words = phrase_words[1:]
+                search_pos = i + 1
+
+                for phrase_word in remaining_words:
+                    word_found = False
+                    while search_pos < len(cleaned_words):
+                        if (cleaned_words[search_pos]['start'], cleaned_words[search_pos]['end']) not in used_timestamps:
+                            if words_match(cleaned_words[search_pos]['word'], phrase_word):
+                                phrase_end = cleaned_words[search_pos]['end']
+                                matched_positions.add(search_pos)
+                                word_found = True
+                                search_pos += 1
+                                break
+                        search_pos += 1
+                    if not word_found:
+                        match_found = False
+                        break
+
+            if match_found:
+                timestamp_used = any(
+                    (cleaned_words[pos]['start'], cleaned_words[pos]['end']) in used_timestamps
+                    for pos in matched_positions
+                )
+                if not timestamp_used:
+                    matches.append((phrase_start, phrase_end, matched_positions))
+        i += 1
+
+    if matches:
+        matches.sort()
+        return matches[0][0], matches[0][1], matches[0][2]
+    return (0, 0, set())
+
+
+class ScanKeywordMapper(KeywordMapper):
+    """KeywordMapper running the reference scan for every keyword"""
+
+    def find_phrase(self, keyword):
+        return scan_phrase_timestamps(keyword, self.words_list, self.last_end_time, self.used_timestamps)
+
+
+def make_transcript(word_count, seed=0, shuffled=False):
+    rng = random.Random(seed)
+    words = []
+    time_ms = 0
+    for _ in range(word_count):
+        word = rng.choice(VOCABULARY)
+        if rng.random() < 0.15:
+            word += rng.choice(".,?!")
+        if rng.random() < 0.1:
+            word = word.capitalize()
+        # Occasional zero gap words share a start time
+        time_ms += rng.choice((0, 120, 180, 240, 300))
+        words.append({"word": word, "start": time_ms, "end": time_ms + 150})
+    if shuffled:
+        rng.shuffle(words)
+    return words
+
+
+def make_keywords(words_list, every=8, seed=0):
+    """Keywords taken from the transcript in order, with some that never occur"""
+    rng = random.Random(seed)
+    keywords = []
+    for order_id, pos in enumerate(range(0, len(words_list) - 3, every), start=1):
+        length = rng.choice((1, 1, 2, 3))
+        phrase = " ".join(entry["word"].rstrip(".,?!") for entry in words_list[pos:pos + length])
+        if rng.random() < 0.05:
+            phrase = "kubernetes " + phrase
+        keywords.append({"order_id": order_id, "type": rng.choice(("image", "gif", "text")), "keyword": phrase})
+    return keywords
+
+
+def map_all(mapper_class, words_list, keywords):
+    mapper = mapper_class(words_list)
+    for keyword_entry in keywords:
+        mapper.add(keyword_entry)
+    return mapper.finalize()
+
+
+def check_equivalence(seeds=20):
+    for seed in range(seeds):
+        for shuffled in (False, True):
+            words_list = make_transcript(400, seed, shuffled)
+            keywords = make_keywords(words_list, every=5, seed=seed)
+            expected = map_all(ScanKeywordMapper, words_list, keywords)
+            assert map_all(KeywordMapper, words_list, keywords) == expected, (seed, shuffled)
+    print(f"Identical output on {seeds * 2} generated transcripts")
+
+
+def reference_alignment(tokens, words_list):
+    """Number of tokens matched by an unbanded LCS with words_match semantics"""
+    words = [clean_word(entry['word']) for entry in words_list]
+    previous = [0] * (len(words) + 1)
+    for _, token, _ in tokens:
+        row = [0]
+        for j, word in enumerate(words):
+            row.append(max(previous[j + 1], row[j], previous[j] + 1 if words_match(word, token) else 0))
+        previous = row
+    return previous[-1]
+
+
+def check_alignment(seeds=20):
+    """The banded DP must match as many tokens as the full LCS, in order and on matching words"""
+    cases = [([{"word": w, "start": i * 200, "end": i * 200 + 150} for i, w in enumerate("Python is fast".split())],
+              [{"keyword": k} for k in ("kubernetes", "python", "fast")])]
+    for seed in range(seeds):
+        words_list = make_transcript(300, seed)
+        cases.append((words_list, make_keywords(words_list, every=5, seed=seed)))
+
+    for words_list, keywords in cases:
+        table = WordTable(words_list)
+        tokens = [(k, clean_word(word), None)
+                  for k, keyword_entry in enumerate(keywords) for word in keyword_entry['keyword'].lower().split()]
+        pairs = sorted(align_tokens(tokens, table))
+        for (i, j), (next_i, next_j) in zip(pairs, pairs[1:]):
+            assert i < next_i and j < next_j, pairs
+        for i, j in pairs:
+            assert words_match(table.words[j], tokens[i][1]), (tokens[i], table.words[j])
+        assert len(pairs) == reference_alignment(tokens, words_list), (len(pairs), keywords)
+    print(f"Global alignment matches the reference LCS on {len(cases)} transcripts")
+
+
+def main(sizes=(1000, 2000, 4000, 8000)):
+    check_equivalence()
+    check_alignment()
+    print(f"{'words':>7} {'keywords':>9} {'scan s':>9} {'table s':>9} {'speedup':>9}")
+    for size in sizes:
+        words_list = make_transcript(size)
+        keywords = make_keywords(words_list)
+
+        start = time.perf_counter()
+        expected = map_all(ScanKeywordMapper, words_list, keywords)
+        scan = time.perf_counter() - start
+
+        start = time.perf_counter()
+        result = map_all(KeywordMapper, words_list, keywords)
+        table = time.perf_counter() - start
+
+        assert result == expected
+        print(f"{size:>7} {len(keywords):>9} {scan:>9.3f} {table:>9.3f} {scan / table:>8.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+
+from sqlitecache import SqliteLRUCache, get_cache
+
+MEDIA_CACHE_DIR = "output/cache/media"
+MEDIA_CACHE_TTL = 30 * 24 * 3600        # seconds before an entry is searched again
+MEDIA_CACHE_MAX_BYTES = 5 * 1024 ** 3   # size budget for all blobs
+
+
+def normalize_query(query):
+    return " ".join(query.lower().split())
+
+
+class MediaCache(SqliteLRUCache):
+    """
+    On-disk media cache keyed by (provider, normalized query, result index).
+
+    Each key points at a content-hashed blob, so the same asset returned for
+    different queries is stored once. Entries expire after ttl seconds, and the
+    least recently used entries are evicted once the blobs exceed max_bytes.
+    Hits are hard-linked (or copied) into the job's media path. The index is
+    a sqlite database so concurrent jobs can share one cache.
+    """
+
+    def __init__(self, root=MEDIA_CACHE_DIR, ttl=MEDIA_CACHE_TTL, max_bytes=MEDIA_CACHE_MAX_BYTES):
+        self.blob_dir = os.path.join(root, "blobs")
+        os.makedirs(self.blob_dir, exist_ok=True)
+        super().__init__(root, "index.db", [
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " provider TEXT, query TEXT, result_index INTEGER, blob TEXT, size INTEGER,"
+            " created REAL, last_used REAL, PRIMARY KEY (provider, query, result_index))"
+        ], ttl, max_bytes)
+
+    def blob_path(self, blob):
+        return os.path.join(self.blob_dir, blob[:2], blob)
+
+    def fetch(self, provider, query, output_path, result_index=0):
+        """Link a cached asset into output_path, returning output_path on a hit or None on a miss"""
+        key = (provider, normalize_query(query), result_index)
+        now = time.time()
+        with self.connect() as db:
+            row = db.execute(
+                "SELECT blob, created FROM entries WHERE provider = ? AND query = ? AND result_index = ?", key
+            ).fetchone()
+
+            if row is not None and (self.expired(row[1], now) or not os.path.exists(self.blob_path(row[0]))):
+                db.execute("DELETE FROM entries WHERE provider = ? AND query = ? AND result_index = ?", key)
+                row = None
+
+            if row is None:
+                self.count(db, "misses")
+                return None
+
+            db.execute(
+                "UPDATE entries SET last_used = ? WHERE provider = ? AND query = ? AND result_index = ?",
+                (now, *key)
+            )
+            self.count(db, "hits")
+
+        output_dir = os.path.dirname(output_path)
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        try:
+            os.link(self.blob_path(row[0]), output_path)
+        except OSError:
+            try:
+                shutil.copyfile(self.blob_path(row[0]), output_path)
+            except OSError:
+                # Evicted by another job in the meantime
+                return None
+        return output_path
+
+    def store(self, provider, query, source_path, result_index=0):
+        """Add a downloaded asset to the cache under its content hash"""
+        digest = hashlib.sha256()
+        with open(source_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+        blob = digest.hexdigest()
+        blob_path = self.blob_path(blob)
+
+        if not os.path.exists(blob_path):
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(blob_path))
+            os.close(fd)
+            shutil.copyfile(source_path, temp_path)
+            os.replace(temp_path, blob_path)
+
+        now = time.time()
+        with self.connect() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (provider, normalize_query(query), result_index, blob, os.path.getsize(blob_path), now, now)
+            )
+        self.evict()
+
+    def lru_units(self, db):
+        # A blob is evicted with every entry pointing at it
+        return db.execute(
+            "SELECT blob, MAX(size) FROM entries GROUP BY blob ORDER BY MAX(last_used)"
+        ).fetchall()
+
+    def drop_unit(self, db, blob):
+        db.execute("DELETE FROM entries WHERE blob = ?", (blob,))
+        if os.path.exists(self.blob_path(blob)):
+            os.remove(self.blob_path(blob))
+
+    def usage(self, db):
+        entries, = db.execute("SELECT COUNT(*) FROM entries").fetchone()
+        size, = db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM (SELECT MAX(size) AS size FROM entries GROUP BY blob)"
+        ).fetchone()
+        return entries, size
+
+
+def get_media_cache():
+    """Process wide MediaCache, or None when disabled with MEDIA_CACHE=off"""
+    return get_cache(MediaCache, "MEDIA", MEDIA_CACHE_DIR, MEDIA_CACHE_TTL, MEDIA_CACHE_MAX_BYTES)
+
+
+if __name__ == "__main__":
+    cache = get_media_cache()
+    print(cache.stats() if cache else "MEDIA_CACHE is off")
@@ -0,0 +1,99 @@
+import hashlib
+import json
+import os
+import subprocess
+import tempfile
+from moviepy.config import get_setting
+
+from ffmpegvideomaker import fit_filter
+
+# Normalized media is shared between runs, keyed by source content and target format
+NORMALIZED_CACHE_DIR = "output/cache/normalized"
+
+
+def file_hash(path, chunk_size=1 << 20):
+    """sha256 of a file's content"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def normalize_file(source_path, media_type, resolution=(1920, 1080), fps=24, margin=40,
+                   cache_dir=NORMALIZED_CACHE_DIR):
+    """
+    Resize and pad a downloaded image or GIF mp4 to the final frame size once.
+
+    Images become a full frame PNG, GIF mp4s are transcoded to the target size and
+    fps. Results are cached under a hash of the source content and the target
+    format, so the same asset is only normalized once. Returns the cached path.
+    """
+    width, height = resolution
+    key = hashlib.sha256(
+        f"{file_hash(source_path)}:{media_type}:{width}x{height}:{fps}:{margin}".encode()
+    ).hexdigest()
+    extension = 'png' if media_type == 'image' else 'mp4'
+    target_path = os.path.join(cache_dir, f"{key}.{extension}")
+    if os.path.exists(target_path):
+        return target_path
+
+    os.makedirs(cache_dir, exist_ok=True)
+    # Write next to the target and rename so a failed run never leaves a partial file
+    fd, temp_path = tempfile.mkstemp(suffix=f".tmp.{extension}", dir=cache_dir)
+    os.close(fd)
+
+    if media_type == 'image':
+        command = [
+            get_setting("FFMPEG_BINARY"), '-y', '-loglevel', 'error',
+            '-i', source_path,
+            '-vf', fit_filter(resolution, margin),
+            '-frames:v', '1',
+            temp_path
+        ]
+    else:
+        command = [
+            get_setting("FFMPEG_BINARY"), '-y', '-loglevel', 'error',
+            '-i', source_path,
+            '-vf', f"fps={fps},{fit_filter(resolution, margin)},format=yuv420p",
+            '-an', '-c:v', 'libx264', '-preset', 'fast', '-crf', '18',
+            temp_path
+        ]
+
+    result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise RuntimeError(f"ffmpeg failed for {source_path}: {result.stderr.decode(errors='replace')}")
+
+    os.replace(temp_path, target_path)
+    return target_path
+
+
+def normalize_media(data, resolution=(1920, 1080), fps=24, margin=40, cache_dir=NORMALIZED_CACHE_DIR):
+    """
+    Normalize every downloaded image and GIF in the mapped keyword list.
+
+    Returns a copy of the list where each normalized entry has a 'normalized_path'
+    that create_clip can load without resizing. Entries whose media is missing or
+    fails to normalize are left untouched.
+    """
+    normalized = []
+    for keyword in data:
+        keyword = keyword.copy()
+        if keyword['type'] in ('image', 'gif') and os.path.exists(keyword['path']):
+            try:
+                keyword['normalized_path'] = normalize_file(
+                    keyword['path'], keyword['type'], resolution, fps, margin, cache_dir
+                )
+            except Exception as e:
+                print(f"Error normalizing {keyword['path']}: {e}")
+        normalized.append(keyword)
+    return normalized
+
+
+if __name__ == "__main__":
+    with open('output/mapped.json', 'r') as file:
+        data = json.load(file)
+    for keyword in normalize_media(data):
+        print(f"{keyword['path']} -> {keyword.get('normalized_path')}")
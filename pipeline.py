@@ -0,0 +1,210 @@
+import argparse
+import ast
+import hashlib
+import json
+import os
+import shutil
+
+# Results of every stage are kept here, one folder per (stage, input hash)
+STAGE_CACHE_DIR = "output/cache/stages"
+
+
+class Stage:
+    """
+    A step of the video pipeline with declared file inputs and outputs.
+
+    run is called with the stage's params as keyword arguments and must write
+    every path in outputs. Outputs can be files or directories.
+    """
+
+    def __init__(self, name, inputs, outputs, run, params=None):
+        self.name = name
+        self.inputs = inputs
+        self.outputs = outputs
+        self.run = run
+        self.params = params or {}
+
+
+def hash_path(path, digest):
+    """Feed the content of a file or a whole directory into a hash"""
+    if os.path.isdir(path):
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                file_path = os.path.join(root, name)
+                digest.update(os.path.relpath(file_path, path).encode())
+                hash_path(file_path, digest)
+    elif os.path.exists(path):
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+    else:
+        digest.update(b'<missing>')
+
+
+def path_digest(path):
+    digest = hashlib.sha256()
+    hash_path(path, digest)
+    return digest.hexdigest()
+
+
+def module_files(*paths):
+    """
+    The given module files plus every module of this repo they import, directly
+    or through other modules, so editing a helper also invalidates the stages
+    using it. Imports are found statically, including ones inside functions.
+    """
+    found = []
+    pending = list(paths)
+    while pending:
+        path = pending.pop(0)
+        if path in found:
+            continue
+        found.append(path)
+        with open(path, 'r', encoding='utf-8') as f:
+            tree = ast.parse(f.read(), path)
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                names = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+                names = [node.module]
+            else:
+                continue
+            for name in names:
+                module_path = os.path.join(os.path.dirname(path), name.split('.')[0] + ".py")
+                if os.path.exists(module_path):
+                    pending.append(module_path)
+    return found
+
+
+def stage_key(stage):
+    """Hash of the stage name, its params and the content of all its inputs"""
+    digest = hashlib.sha256()
+    digest.update(stage.name.encode())
+    digest.update(json.dumps(stage.params, sort_keys=True, default=str).encode())
+    for path in stage.inputs:
+        digest.update(path.encode())
+        hash_path(path, digest)
+    return digest.hexdigest()
+
+
+def copy_path(source, target):
+    if os.path.isdir(target):
+        shutil.rmtree(target)
+    if os.path.isdir(source):
+        shutil.copytree(source, target)
+    else:
+        if os.path.dirname(target):
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.copy2(source, target)
+
+
+def remove_path(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+def set_aside(outputs):
+    """Rename existing outputs out of the way; returns {output: moved path}"""
+    moved = {}
+    for output in outputs:
+        if os.path.exists(output):
+            aside = output.rstrip("/\\") + ".previous"
+            remove_path(aside)
+            os.replace(output, aside)
+            moved[output] = aside
+    return moved
+
+
+def restore(moved):
+    """Put outputs moved by set_aside back, dropping whatever a failed run wrote"""
+    for output, aside in moved.items():
+        remove_path(output)
+        os.replace(aside, output)
+
+
+def order_stages(stages):
+    """Topologically sort stages so every stage runs after the producers of its inputs"""
+    producers = {output: stage for stage in stages for output in stage.outputs}
+    ordered = []
+    visiting = set()
+
+    def visit(stage):
+        if stage in ordered:
+            return
+        if stage.name in visiting:
+            raise ValueError(f"Cycle in pipeline at stage: {stage.name}")
+        visiting.add(stage.name)
+        for path in stage.inputs:
+            if path in producers:
+                visit(producers[path])
+        visiting.discard(stage.name)
+        ordered.append(stage)
+
+    for stage in stages:
+        visit(stage)
+    return ordered
+
+
+def run_stages(stages, start=None, stop=None, force=False, cache_dir=STAGE_CACHE_DIR):
+    """
+    Run the pipeline in dependency order, skipping stages whose inputs are unchanged.
+
+    Each stage is keyed by the hash of its params and input contents. On a hit its
+    cached outputs are restored instead of running it. start and stop limit the run
+    to a range of stage names; stages before start are assumed to be done already
+    and the start stage itself always runs.
+    """
+    ordered = order_stages(stages)
+    names = [stage.name for stage in ordered]
+    for name in (start, stop):
+        if name is not None and name not in names:
+            raise ValueError(f"Unknown stage: {name}. Available stages: {', '.join(names)}")
+
+    first = names.index(start) if start else 0
+    last = names.index(stop) if stop else len(names) - 1
+
+    for stage in ordered[first:last + 1]:
+        key = stage_key(stage)
+        entry_dir = os.path.join(cache_dir, stage.name, key)
+        cached_outputs = [os.path.join(entry_dir, str(i)) for i in range(len(stage.outputs))]
+
+        if not force and stage.name != start and all(os.path.exists(path) for path in cached_outputs):
+            print(f"[{stage.name}] inputs unchanged, using cached result")
+            for cached, output in zip(cached_outputs, stage.outputs):
+                # Only restore outputs that were changed or removed since
+                if not os.path.exists(output) or path_digest(output) != path_digest(cached):
+                    copy_path(cached, output)
+            continue
+
+        print(f"[{stage.name}] running ...")
+        # Move the previous outputs aside, so a stage that fails without raising
+        # cannot leave them behind to be cached as its result
+        previous = set_aside(stage.outputs)
+        try:
+            stage.run(**stage.params)
+            missing = [path for path in stage.outputs if not os.path.exists(path)]
+            if missing:
+                raise RuntimeError(f"Stage '{stage.name}' did not produce: {', '.join(missing)}")
+        except BaseException:
+            restore(previous)
+            raise
+        for aside in previous.values():
+            remove_path(aside)
+
+        # Store the outputs under the input hash
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        os.makedirs(entry_dir, exist_ok=True)
+        for output, cached in zip(stage.outputs, cached_outputs):
+            copy_path(output, cached)
+
+
+def build_arg_parser(stages):
+    names = [stage.name for stage in order_stages(stages)]
+    parser = argparse.ArgumentParser(description="Run the video pipeline, skipping unchanged stages.")
+    parser.add_argument("--from", dest="start", choices=names, help="first stage to run")
+    parser.add_argument("--to", dest="stop", choices=names, help="last stage to run")
+    parser.add_argument("--force", action="store_true", help="ignore cached results")
+    return parser
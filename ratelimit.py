@@ -0,0 +1,159 @@
+import os
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+# Default request rates (requests per second, burst size) per provider. Override
+# the rate with e.g. RATE_LIMIT_GEMINI=0.5 in the environment; 0 means unlimited.
+RATE_LIMITS = {
+    "gemini": (0.25, 2),       # free tier allows 15 requests a minute
+    "unsplash": (1.0, 4),
+    "google": (1.5, 4),        # Custom Search allows 100 queries a minute
+    "tenor": (5.0, 8),
+    "elevenlabs": (2.0, 2),
+    "playht": (2.0, 2),
+    "assemblyai": (5.0, 5),
+}
+DEFAULT_RATE_LIMIT = (2.0, 4)
+
+MAX_ATTEMPTS = 5
+BACKOFF_BASE = 1.0   # seconds before the first retry, doubled on each attempt
+BACKOFF_MAX = 30.0
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """
+    Token bucket refilled at rate tokens per second, holding at most burst tokens.
+
+    acquire() blocks until a token is available. pause() stops handing out tokens
+    for a while, so one 429 slows down every worker sharing the bucket. A rate
+    of 0 never runs out of tokens, only pauses apply.
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if now >= self.paused_until and self.rate == 0:
+                    return
+                if now >= self.paused_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                if self.rate == 0:
+                    wait = self.paused_until - now
+                else:
+                    wait = max(self.paused_until - now, (1 - self.tokens) / self.rate)
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(provider):
+    """Process wide TokenBucket for provider, shared by every worker thread"""
+    with _limiters_lock:
+        limiter = _limiters.get(provider)
+        if limiter is None:
+            rate, burst = RATE_LIMITS.get(provider, DEFAULT_RATE_LIMIT)
+            variable = f"RATE_LIMIT_{provider.upper()}"
+            try:
+                rate = float(os.getenv(variable, rate))
+            except ValueError:
+                raise ValueError(f"{variable} must be a number of requests per second, "
+                                 f"got {os.getenv(variable)!r}")
+            # Zero or negative rates turn the limit off
+            rate = max(0.0, rate)
+            limiter = _limiters[provider] = TokenBucket(rate, burst)
+        return limiter
+
+
+def parse_retry_after(value):
+    """Seconds to wait from a Retry-After header (delta seconds or HTTP date), or None"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt, retry_after=None):
+    """Full jitter exponential backoff, never shorter than the server's Retry-After"""
+    delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return delay
+
+
+def error_status(error):
+    """HTTP status carried by an SDK or requests exception, if any"""
+    for attr in ("status_code", "code", "status"):
+        value = getattr(error, attr, None)
+        if isinstance(value, int):
+            return value
+    response = getattr(error, "response", None)
+    return getattr(response, "status_code", None)
+
+
+def error_retry_after(error):
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or getattr(error, "headers", None) or {}
+    return parse_retry_after(headers.get("Retry-After"))
+
+
+def call_with_retry(provider, func, *args, **kwargs):
+    """
+    Call func under the provider's rate limit, retrying with backoff when it raises
+    an error carrying a 429 or 5xx status. Other errors are raised immediately.
+    """
+    limiter = get_limiter(provider)
+    for attempt in range(MAX_ATTEMPTS):
+        limiter.acquire()
+        try:
+            return func(*args, **kwargs)
+        except Exception as e:
+            if error_status(e) not in RETRY_STATUSES or attempt == MAX_ATTEMPTS - 1:
+                raise
+            delay = backoff_delay(attempt, error_retry_after(e))
+            print(f"{provider} request failed ({e}), retrying in {delay:.1f}s")
+            limiter.pause(delay)
+
+
+def send_with_retry(provider, send):
+    """
+    Rate limited HTTP request: send() returns a requests.Response, which is retried
+    with backoff on 429 and 5xx statuses, honouring Retry-After. The last response
+    is returned once the attempts run out so callers can report it.
+    """
+    limiter = get_limiter(provider)
+    for attempt in range(MAX_ATTEMPTS):
+        limiter.acquire()
+        response = send()
+        if response.status_code not in RETRY_STATUSES or attempt == MAX_ATTEMPTS - 1:
+            return response
+        delay = backoff_delay(attempt, parse_retry_after(response.headers.get("Retry-After")))
+        print(f"{provider} returned {response.status_code}, retrying in {delay:.1f}s")
+        response.close()
+        limiter.pause(delay)
+    return response
@@ -0,0 +1,69 @@
+import glob
+import os
+import resource
+import threading
+
+
+def child_process_count():
+    """Number of live child processes of this process (Linux only, 0 elsewhere)"""
+    count = 0
+    for path in glob.glob(f"/proc/{os.getpid()}/task/*/children"):
+        try:
+            with open(path) as f:
+                count += len(f.read().split())
+        except OSError:
+            continue
+    return count
+
+
+def current_rss_mb():
+    """Resident set size of this process in MB (Linux only, 0 elsewhere)"""
+    try:
+        with open(f"/proc/{os.getpid()}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+class ResourceMonitor:
+    """
+    Sample peak RSS and child process count in a background thread.
+
+    Used as a context manager around a render:
+
+        with ResourceMonitor() as monitor:
+            final_clip.write_videofile(...)
+        print(monitor.summary())
+    """
+
+    def __init__(self, interval=0.5):
+        self.interval = interval
+        self.peak_rss_mb = 0
+        self.peak_processes = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def sample(self):
+        self.peak_rss_mb = max(self.peak_rss_mb, current_rss_mb())
+        self.peak_processes = max(self.peak_processes, child_process_count())
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.sample()
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._stop.set()
+        self._thread.join()
+        self.sample()
+        # ru_maxrss is reported in KB on Linux
+        self.peak_rss_mb = max(self.peak_rss_mb, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024)
+        return False
+
+    def summary(self):
+        return f"Peak RSS: {self.peak_rss_mb:.0f} MB, peak child processes: {self.peak_processes}"
@@ -3,6 +3,10 @@ from dotenv import load_dotenv
 import os
 import json
 
+from jobcontext import DEFAULT_JOB
+from llmcache import cached_generate
+from ratelimit import call_with_retry
+
 # Load environment variables from .env file
 load_dotenv()
 
@@ -10,10 +14,16 @@ google_api_key = os.getenv('GEMINI_API_KEY')
 
 genai.configure(api_key=google_api_key)
 
-def generate_script(prompt, output_format="text"):
+def generate_script(prompt, output_format="text", job=None, use_cache=True):
+    """
+    Writes a narration script for prompt to the job folder. The same prompt is
+    answered from the LLM response cache unless use_cache is False.
+    """
+    job = job or DEFAULT_JOB
     try:
         print("Generating Script ...")
-        model = genai.GenerativeModel("gemini-1.5-flash")
+        model_name = "gemini-1.5-flash"
+        model = genai.GenerativeModel(model_name)
 
         system_prompt = f"""Act like Fireship, a tech-focused YouTube channel known for its fast-paced, witty, and snarky narration style. Write a 3–5 minute video script about {prompt}. Make the tone sarcastic, humorous, and self-aware, while breaking down complex ideas into digestible explanations. Use relatable analogies, pop culture references, and sharp commentary to keep it engaging. Include plenty of humor, but also deliver valuable insights and a key takeaway at the end.
 
@@ -24,15 +34,19 @@ The output should be in text format, structured like this:
   "Your Fireship-style narration script goes here as a single string. Make sure it is concise, natural, and humorous, suitable for a 3–5 minute video. Do not add emojis or visual cues; focus purely on the narration text."
 """
 
-        response = model.generate_content(system_prompt)
+        response_text = cached_generate(
+            model_name, system_prompt,
+            lambda: call_with_retry("gemini", model.generate_content, system_prompt).text,
+            use_cache=use_cache
+        )
 
         # Ensure the output directory exists
-        output_dir = "output"
+        output_dir = job.root
         os.makedirs(output_dir, exist_ok=True)  # Create folder if it doesn't exist
 
         if output_format == "json":
             # Save as JSON file
-            result = {"prompt": prompt, "response": response.text}
+            result = {"prompt": prompt, "response": response_text}
             file_path = os.path.join(output_dir, "script.json")
             print(f"Saving to: {file_path}")
             with open(file_path, "w",encoding='utf-8') as f:
@@ -44,7 +58,7 @@ The output should be in text format, structured like this:
             file_path = os.path.join(output_dir, "script.txt")
             print(f"Saving to: {file_path}")
             with open(file_path, "w",encoding='utf-8') as f:
-                f.write(response.text)
+                f.write(response_text)
             print(f"Text saved to {file_path}")
             return file_path
 
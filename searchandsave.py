@@ -1,7 +1,15 @@
 import os
+import threading
+import time
 import requests
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-from urllib.parse import urlencode
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlencode, urlsplit
+
+from mediacache import get_media_cache
+from ratelimit import send_with_retry
 
 load_dotenv()
 unsplash_api_key = os.getenv('UNSPLASH_ACCESS_KEY')
@@ -11,18 +19,207 @@ tenor_api_key = os.getenv('TENOR_API_KEY')
 lmt = 1
 ckey = os.getenv('C_KEY')
 
+# Provider endpoints (overridable, e.g. to point at a local stub server)
+GOOGLE_SEARCH_URL = "https://www.googleapis.com/customsearch/v1"
+UNSPLASH_SEARCH_URL = "https://api.unsplash.com/search/photos"
+TENOR_SEARCH_URL = "https://tenor.googleapis.com/v2/search"
+
+# (connect, read) timeouts in seconds for every request
+REQUEST_TIMEOUT = (5, 30)
+# Keep-alive connections kept per host, and requests in flight per host
+HOST_POOL_SIZE = 8
+HOST_CONCURRENCY = 4
+# Largest asset we are willing to download, and the chunk size used to stream it
+MAX_DOWNLOAD_BYTES = 25 * 1024 * 1024
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+# Attempts for a download; later attempts resume with a Range request when possible
+DOWNLOAD_ATTEMPTS = 3
+# Image lookups race Unsplash against Google when set. "auto" starts Google once
+# Unsplash has run longer than its observed p90 latency, a number of seconds uses
+# a fixed hedge delay (0 starts both at once). Unset keeps the plain fallback.
+IMAGE_HEDGE = os.getenv("IMAGE_HEDGE")
+HEDGE_DEFAULT_DELAY = 1.0   # used by "auto" until enough latencies are recorded
+HEDGE_MIN_SAMPLES = 20
+LATENCY_WINDOW = 200        # recent lookups kept per provider
+
+_sessions = {}
+_host_limits = {}
+_sessions_lock = threading.Lock()
+
+
+def get_session(url):
+    """Return the shared Session (and its concurrency limit) for the url's host"""
+    host = urlsplit(url).netloc
+    with _sessions_lock:
+        session = _sessions.get(host)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HOST_POOL_SIZE)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _sessions[host] = session
+            _host_limits[host] = threading.BoundedSemaphore(HOST_CONCURRENCY)
+        return session, _host_limits[host]
+
+
+def from_cache(provider, keyword, output_path):
+    """Link a previously downloaded asset into output_path, returning it on a cache hit"""
+    cache = get_media_cache()
+    if cache is not None and cache.fetch(provider, keyword, output_path):
+        print(f"Using cached {provider} result for '{keyword}': {output_path}")
+        return output_path
+    return None
+
+
+def save_to_cache(provider, keyword, output_path):
+    cache = get_media_cache()
+    if cache is not None:
+        try:
+            cache.store(provider, keyword, output_path)
+        except Exception as e:
+            print(f"Error caching {output_path}: {e}")
+
+
+def http_get(url, params=None, provider=None, limit_held=False, **kwargs):
+    """
+    GET through the host's pooled keep-alive session with explicit timeouts.
+    API calls pass their provider to go through its shared rate limiter, which
+    also retries 429 and 5xx responses.
+
+    The host's concurrency limit is held while the request is sent. Callers
+    streaming the body pass limit_held=True once they hold it themselves for the
+    whole transfer.
+    """
+    session, limit = get_session(url)
+    kwargs.setdefault("timeout", REQUEST_TIMEOUT)
+
+    def send():
+        if limit_held:
+            return session.get(url, params=params, **kwargs)
+        with limit:
+            return session.get(url, params=params, **kwargs)
+
+    if provider is None:
+        return send()
+    return send_with_retry(provider, send)
+
+
+_download_stats = {}
+_download_stats_lock = threading.Lock()
+
+
+class DownloadCancelled(Exception):
+    pass
+
+
+def record_download(provider, downloaded=0, seconds=0.0, saved=0, files=0, rejected=0, cancelled=0):
+    with _download_stats_lock:
+        stats = _download_stats.setdefault(
+            provider, {"files": 0, "bytes": 0, "seconds": 0.0, "bytes_saved": 0, "rejected": 0, "cancelled": 0}
+        )
+        stats["files"] += files
+        stats["bytes"] += downloaded
+        stats["seconds"] += seconds
+        stats["bytes_saved"] += saved
+        stats["rejected"] += rejected
+        stats["cancelled"] += cancelled
 
 
+def download_stats():
+    """
+    Per provider download totals: files, bytes, seconds, bytes/sec, rejected
+    (over the size cap), cancelled (hedged lookups that lost the race) and
+    bytes_saved (not fetched thanks to size checks and resumes).
+    """
+    with _download_stats_lock:
+        report = {provider: dict(stats) for provider, stats in _download_stats.items()}
+    for stats in report.values():
+        stats["bytes_per_sec"] = stats["bytes"] / stats["seconds"] if stats["seconds"] else 0
+    return report
+
+
+def download_to_file(url, output_path, provider, max_bytes=MAX_DOWNLOAD_BYTES, resume=False, cancel=None):
+    """
+    Streams url to output_path in chunks without holding the asset in memory.
+
+    Downloads larger than max_bytes are refused up front from Content-Length, or
+    aborted once they grow past it. Data goes to a .part file that is renamed into
+    place only when complete, so a failure never leaves a half written output.
+    With resume, failed attempts are continued with a Range request. Setting the
+    optional cancel event aborts the download between chunks.
 
-def search_and_save_image_google(keyword, output_path):
+    :return: True if the file was saved, otherwise False.
+    """
+    part_path = f"{output_path}.part"
+    if os.path.exists(part_path):
+        os.remove(part_path)
+
+    try:
+        for attempt in range(DOWNLOAD_ATTEMPTS if resume else 1):
+            offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+            headers = {"Range": f"bytes={offset}-"} if offset else {}
+            start = time.perf_counter()
+            downloaded = 0
+            try:
+                # Hold the host limit until the body is read, not just the headers
+                with get_session(url)[1], http_get(url, headers=headers, stream=True, limit_held=True) as response:
+                    if response.status_code not in (200, 206):
+                        print(f"Download failed with status {response.status_code}: {url}")
+                        break
+                    if response.status_code == 200:
+                        # Server ignored the Range header, start over
+                        offset = 0
+
+                    content_length = response.headers.get("Content-Length")
+                    if content_length is not None and offset + int(content_length) > max_bytes:
+                        print(f"Skipping {url}: {offset + int(content_length)} bytes exceeds the "
+                              f"{max_bytes} byte limit")
+                        record_download(provider, saved=int(content_length), rejected=1)
+                        break
+
+                    with open(part_path, "ab" if offset else "wb") as f:
+                        for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                            downloaded += len(chunk)
+                            if offset + downloaded > max_bytes:
+                                raise ValueError(f"download exceeds the {max_bytes} byte limit")
+                            if cancel is not None and cancel.is_set():
+                                raise DownloadCancelled()
+                            f.write(chunk)
+
+                os.replace(part_path, output_path)
+                record_download(provider, downloaded, time.perf_counter() - start, saved=offset, files=1)
+                return True
+
+            except DownloadCancelled:
+                record_download(provider, downloaded, time.perf_counter() - start, cancelled=1)
+                break
+            except ValueError as e:
+                print(f"Skipping {url}: {e}")
+                record_download(provider, downloaded, time.perf_counter() - start, rejected=1)
+                break
+            except requests.RequestException as e:
+                record_download(provider, downloaded, time.perf_counter() - start)
+                print(f"Download attempt {attempt + 1} failed for {url}: {e}")
+    finally:
+        # Only failures that can be resumed keep the part file, and only between attempts
+        if os.path.exists(part_path):
+            os.remove(part_path)
+    return False
+
+
+def search_and_save_image_google(keyword, output_path, cancel=None, check_cache=True):
     """
     Searches for an image using Google Custom Search and saves it to the specified output path.
     
     :param keyword: The search keyword for the image.
     :param output_path: The full path, including the filename, where the image will be saved.
+    :param check_cache: False skips the media cache lookup when the caller already did it.
     :return: The path of the saved image if successful, otherwise None.
     """
     try:
+        if check_cache and from_cache("google", keyword, output_path):
+            return output_path
+
         # Validate input parameters
         if not google_api_key or not search_engine_id:
             print("API Key and Search Engine ID are required.")
@@ -41,8 +238,8 @@ def search_and_save_image_google(keyword, output_path):
             "searchType": "image",
             "num": 1
         }
-        url = f"https://www.googleapis.com/customsearch/v1?{urlencode(params)}"
-        response = requests.get(url)
+        url = f"{GOOGLE_SEARCH_URL}?{urlencode(params)}"
+        response = http_get(url, provider="google")
         
         # Check for API response success
         if response.status_code != 200:
@@ -58,13 +255,10 @@ def search_and_save_image_google(keyword, output_path):
         image_url = response_json["items"][0]["link"]
         print(f"Found image URL: {image_url}")
         
-        # Download the image content
-        image_response = requests.get(image_url)
-        if image_response.status_code == 200:
-            # Save the image locally
-            with open(output_path, "wb") as f:
-                f.write(image_response.content)
+        # Stream the image to disk
+        if download_to_file(image_url, output_path, "google", cancel=cancel):
             print(f"Image saved: {output_path}")
+            save_to_cache("google", keyword, output_path)
             return output_path
         else:
             print(f"Failed to download image from URL: {image_url}")
@@ -76,17 +270,20 @@ def search_and_save_image_google(keyword, output_path):
 
     
 
-def search_and_save_image_unsplash(keyword, output_path):
+def search_and_save_image_unsplash(keyword, output_path, cancel=None, check_cache=True):
 
     try:
+        if check_cache and from_cache("unsplash", keyword, output_path):
+            return output_path
+
         print("Collecting images ...")
 
         # Ensure the directory for output_path exists
         os.makedirs(os.path.dirname(output_path), exist_ok=True)
 
         # Unsplash API request
-        url = f"https://api.unsplash.com/search/photos?query={keyword}&client_id={unsplash_api_key}&per_page=1"
-        response = requests.get(url)
+        params = {"query": keyword, "client_id": unsplash_api_key, "per_page": 1}
+        response = http_get(UNSPLASH_SEARCH_URL, params=params, provider="unsplash")
         if response.status_code != 200:
             print(f"Failed to fetch image for keyword '{keyword}': {response.text}")
             return None
@@ -100,13 +297,10 @@ def search_and_save_image_unsplash(keyword, output_path):
         image_url = results[0]["urls"]["regular"]
         print(f"Found image URL: {image_url}")
 
-        # Download the image content
-        image_response = requests.get(image_url)
-        if image_response.status_code == 200:
-            # Save the image locally
-            with open(output_path, "wb") as f:
-                f.write(image_response.content)
+        # Stream the image to disk
+        if download_to_file(image_url, output_path, "unsplash", cancel=cancel):
             print(f"Image saved: {output_path}")
+            save_to_cache("unsplash", keyword, output_path)
             return output_path
         else:
             print(f"Failed to download image from URL: {image_url}")
@@ -126,10 +320,13 @@ def search_and_save_GIF(search_term, output_path):
     :return: The path of the saved file if successful, otherwise None.
     """
     try:
+        if from_cache("tenor", search_term, output_path):
+            return output_path
+
         # Get the GIF data from the Tenor API
         print(f"Searching for GIF with search term: '{search_term}'")
-        url = f"https://tenor.googleapis.com/v2/search?q={search_term}&key={tenor_api_key}&client_key={ckey}&limit={lmt}"
-        r = requests.get(url)
+        params = {"q": search_term, "key": tenor_api_key, "client_key": ckey, "limit": lmt}
+        r = http_get(TENOR_SEARCH_URL, params=params, provider="tenor")
 
         if r.status_code != 200:
             print(f"Failed to fetch GIF data: {r.text}")
@@ -147,13 +344,11 @@ def search_and_save_GIF(search_term, output_path):
         # Ensure the directory for output_path exists
         os.makedirs(os.path.dirname(output_path), exist_ok=True)
 
-        # Download the MP4 content
-        mp4_response = requests.get(mp4_url)
-        if mp4_response.status_code == 200:
-            # Save the MP4 file locally
-            with open(output_path, "wb") as f:
-                f.write(mp4_response.content)
+        # Stream the MP4 to disk
+        # GIF mp4s can be large, resume them with range requests if the connection drops
+        if download_to_file(mp4_url, output_path, "tenor", resume=True):
             print(f"MP4 file downloaded successfully: {output_path}")
+            save_to_cache("tenor", search_term, output_path)
             return output_path
         else:
             print("Failed to download the MP4 file.")
@@ -162,89 +357,155 @@ def search_and_save_GIF(search_term, output_path):
     except Exception as e:
         print(f"Error during GIF search and save: {e}")
         return None
-    
-def search_and_save_image_unsplash(keyword, output_path):
 
-    try:
-        print("Collecting images ...")
 
-        # Ensure the directory for output_path exists
-        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+_latencies = {}
+_latencies_lock = threading.Lock()
 
-        # Unsplash API request
-        url = f"https://api.unsplash.com/search/photos?query={keyword}&client_id={unsplash_api_key}&per_page=1"
-        response = requests.get(url)
-        if response.status_code != 200:
-            print(f"Failed to fetch image for keyword '{keyword}': {response.text}")
-            return None
-        
-        results = response.json().get("results", [])
-        if not results:
-            print(f"No images found for keyword '{keyword}'")
-            return None
-        
-        # Get the first image URL
-        image_url = results[0]["urls"]["regular"]
-        print(f"Found image URL: {image_url}")
 
-        # Download the image content
-        image_response = requests.get(image_url)
-        if image_response.status_code == 200:
-            # Save the image locally
-            with open(output_path, "wb") as f:
-                f.write(image_response.content)
-            print(f"Image saved: {output_path}")
-            return output_path
-        else:
-            print(f"Failed to download image from URL: {image_url}")
-            return None
+def record_latency(provider, seconds):
+    with _latencies_lock:
+        _latencies.setdefault(provider, deque(maxlen=LATENCY_WINDOW)).append(seconds)
 
-    except Exception as e:
-        print(f"Error during image search and save: {e}")
-        return None
-    
-def search_and_save_GIF(search_term, output_path):
-    """
-    Searches for a GIF using the Tenor API and saves it as an MP4 file to the specified output path.
 
-    :param search_term: The search term for the GIF.
-    :param output_path: The full path, including the filename, where the MP4 file will be saved.
-    :return: The path of the saved file if successful, otherwise None.
-    """
-    try:
-        # Get the GIF data from the Tenor API
-        print(f"Searching for GIF with search term: '{search_term}'")
-        url = f"https://tenor.googleapis.com/v2/search?q={search_term}&key={tenor_api_key}&client_key={ckey}&limit={lmt}"
-        r = requests.get(url)
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
 
-        if r.status_code != 200:
-            print(f"Failed to fetch GIF data: {r.text}")
-            return None
 
-        gif_data = r.json()
-        if "results" not in gif_data or not gif_data["results"]:
-            print(f"No GIFs found for search term '{search_term}'")
-            return None
+def latency_percentiles(percentiles=(50, 90, 99)):
+    """Recent lookup latency percentiles in seconds per provider, e.g. {"unsplash": {"count": 40, "p50": 0.3, ...}}"""
+    with _latencies_lock:
+        samples = {provider: list(values) for provider, values in _latencies.items()}
+    report = {}
+    for provider, values in samples.items():
+        if values:
+            report[provider] = {"count": len(values)}
+            report[provider].update({f"p{pct}": percentile(values, pct) for pct in percentiles})
+    return report
 
-        # Extract the MP4 URL
-        mp4_url = gif_data["results"][0]["media_formats"]["mp4"]["url"]
-        print(f"Found MP4 URL: {mp4_url}")
 
-        # Ensure the directory for output_path exists
-        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+def hedge_delay(provider, hedge="auto"):
+    """Seconds to wait on provider before starting the next one"""
+    if hedge != "auto":
+        return float(hedge)
+    with _latencies_lock:
+        values = list(_latencies.get(provider, ()))
+    if len(values) < HEDGE_MIN_SAMPLES:
+        return HEDGE_DEFAULT_DELAY
+    return percentile(values, 90)
 
-        # Download the MP4 content
-        mp4_response = requests.get(mp4_url)
-        if mp4_response.status_code == 200:
-            # Save the MP4 file locally
-            with open(output_path, "wb") as f:
-                f.write(mp4_response.content)
-            print(f"MP4 file downloaded successfully: {output_path}")
+
+def timed_lookup(provider, search, keyword, output_path, cancel=None):
+    """
+    Run a provider lookup, recording its latency unless it was cancelled. The
+    caller has already checked the media cache with cached_image.
+    """
+    start = time.perf_counter()
+    result = search(keyword, output_path, cancel=cancel, check_cache=False)
+    if cancel is None or not cancel.is_set():
+        record_latency(provider, time.perf_counter() - start)
+    return result
+
+
+IMAGE_PROVIDERS = [
+    ("unsplash", search_and_save_image_unsplash),
+    ("google", search_and_save_image_google),
+]
+
+
+def cached_image(keyword, output_path):
+    """Check the media cache for every image provider before any of them is timed"""
+    for provider, _ in IMAGE_PROVIDERS:
+        if from_cache(provider, keyword, output_path):
             return output_path
-        else:
-            print("Failed to download the MP4 file.")
-            return None
+    return None
 
-    except Exception as e:
-        print(f"Error during GIF search and save: {e}")
-        return None
\ No newline at end of file
+
+def race_image_providers(keyword, output_path, hedge="auto"):
+    """
+    Hedged image lookup: start Unsplash, start Google after the hedge delay (or
+    as soon as Unsplash fails) and keep the first image that arrives.
+
+    Each provider downloads to its own temporary path and the winner is renamed
+    to output_path. The loser is cancelled: it is never started if the winner
+    finishes within the hedge delay, otherwise its download is aborted.
+    """
+    if cached_image(keyword, output_path):
+        return output_path
+
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    cancel = threading.Event()
+    done = [threading.Event() for _ in IMAGE_PROVIDERS]
+    lock = threading.Lock()
+    winner = []
+    finished = threading.Semaphore(0)
+
+    def attempt(index, provider, search):
+        try:
+            if index > 0:
+                # Wait for the hedge delay, cutting it short if the previous provider failed
+                done[index - 1].wait(hedge_delay(IMAGE_PROVIDERS[index - 1][0], hedge))
+                if cancel.is_set():
+                    return
+            temp_path = f"{output_path}.{provider}"
+            result = timed_lookup(provider, search, keyword, temp_path, cancel)
+            with lock:
+                if result and not winner:
+                    os.replace(temp_path, output_path)
+                    winner.append(provider)
+                    cancel.set()
+                    return
+            if result and os.path.exists(temp_path):
+                os.remove(temp_path)
+        except Exception as e:
+            print(f"Error during {provider} lookup for '{keyword}': {e}")
+        finally:
+            done[index].set()
+            finished.release()
+
+    threads = [
+        threading.Thread(target=attempt, args=(index, provider, search), daemon=True)
+        for index, (provider, search) in enumerate(IMAGE_PROVIDERS)
+    ]
+    for thread in threads:
+        thread.start()
+
+    for _ in threads:
+        finished.acquire()
+        with lock:
+            if winner:
+                print(f"Image for '{keyword}' won by {winner[0]}")
+                return output_path
+    return None
+
+
+def search_and_save_entry(keyword_type, keyword, output_path):
+    """Fetch the media for one keyword using the provider(s) for its type"""
+    if keyword_type == 'image':
+        if IMAGE_HEDGE:
+            return race_image_providers(keyword, output_path, IMAGE_HEDGE)
+        # Try Unsplash first, fallback to Google if Unsplash fails
+        return (cached_image(keyword, output_path)
+                or timed_lookup("unsplash", search_and_save_image_unsplash, keyword, output_path)
+                or timed_lookup("google", search_and_save_image_google, keyword, output_path))
+    if keyword_type == 'gif':
+        return search_and_save_GIF(keyword, output_path)
+    return None
+
+
+def search_and_save_batch(entries, max_workers=8):
+    """
+    Fetches the media for a whole mapped.json list concurrently.
+
+    :param entries: Mapped keyword entries with 'type', 'keyword' and 'path'.
+    :param max_workers: Maximum number of keywords fetched at the same time.
+    :return: A list with the saved path (or None) for every entry, in input order.
+             Entries that are not images or GIFs are returned as None.
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = [
+            pool.submit(search_and_save_entry, entry['type'], entry['keyword'], entry['path'])
+            for entry in entries
+        ]
+        return [future.result() for future in futures]
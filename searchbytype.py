@@ -1,40 +1,108 @@
 import json
+import pygame
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
-from searchandsave import search_and_save_image_google, search_and_save_image_unsplash, search_and_save_GIF
+from searchandsave import search_and_save_entry
 from textvideo import create_video_for_single_keyword
 
+# Default number of concurrent downloads when running with workers
+DOWNLOAD_WORKERS = 8
 
-def search_and_save_by_type(json_file_path):
+
+def init_text_worker():
+    """Set up a text render worker process with its own pygame"""
+    pygame.init()
+
+
+def render_text_keyword(keyword_text, output_path, duration, reveal_time):
+    return create_video_for_single_keyword(keyword_text, output_path, duration=duration, reveal_time=reveal_time)
+
+
+def fetch_keyword(keyword_type, keyword_text, output_path):
+    return search_and_save_entry(keyword_type, keyword_text, output_path)
+
+
+def keyword_timing(keyword):
+    """Return (duration, reveal_time) in seconds for a mapped keyword"""
+    # Calculate duration from start and end timestamps (assuming timestamps are in seconds)
+    if keyword['start'] is not None and keyword['end'] is not None:
+        duration = (keyword['end'] - keyword['start']) / 1000 # Duration in seconds
+        return duration, duration / 5
+
+    print(f"Warning: Missing start or end time for keyword: {keyword['keyword']}")
+    return 0, 0  # Default duration if timestamps are missing
+
+
+def search_and_save_by_type(json_file_path, render_text=True, workers=None, download_workers=DOWNLOAD_WORKERS):
+    """
+    Download or render the media for every keyword in the mapped JSON file.
+
+    Set render_text=False when the video is composed with procedural text clips;
+    text keywords are then skipped here and rendered directly by create_video.
+
+    With workers > 1 text keywords are rendered in a process pool of that size
+    (started only when there is text to render) while image and GIF downloads
+    run concurrently in a thread pool of download_workers threads. The
+    returned list of saved paths (None for failures or skipped keywords) is in
+    the same order as the JSON file either way.
+    """
     # Load the JSON file
     with open(json_file_path, 'r') as file:
         data = json.load(file)
-    
-    # Iterate through each entry in the JSON
-    for keyword in data:
-        keyword_type = keyword['type']
-        keyword_text = keyword['keyword']
-        output_path = keyword['path']
-
-        # Calculate duration from start and end timestamps (assuming timestamps are in seconds)
-        if keyword['start'] is not None and keyword['end'] is not None:
-            duration = (keyword['end'] - keyword['start']) / 1000 # Duration in seconds
-            reveal_time = duration / 5
-        else:
-            print(f"Warning: Missing start or end time for keyword: {keyword_text}")
-            duration = 0  # Default duration if timestamps are missing
-
-        # Call the appropriate function based on the type
-        if keyword_type == 'image':
-            # Try Unsplash first, fallback to Google if Unsplash fails
-            if not search_and_save_image_unsplash(keyword_text, output_path):
-                search_and_save_image_google(keyword_text, output_path)
-        elif keyword_type == 'gif':
-            search_and_save_GIF(keyword_text, output_path)
-        elif keyword_type == 'text':
-            create_video_for_single_keyword(keyword_text, output_path, duration=duration,reveal_time=reveal_time)
-        else:
-            print(f"Unknown type '{keyword_type}' for keyword: {keyword_text}")
+
+    if not workers or workers <= 1:
+        return [process_keyword(keyword, render_text) for keyword in data]
+
+    results = [None] * len(data)
+    # Only start render processes when there is text to render
+    renders_text = render_text and any(keyword['type'] == 'text' for keyword in data)
+    text_pool = ProcessPoolExecutor(max_workers=workers, initializer=init_text_worker) if renders_text else None
+    try:
+        with ThreadPoolExecutor(max_workers=download_workers) as download_pool:
+            futures = {}
+            for index, keyword in enumerate(data):
+                keyword_type = keyword['type']
+                keyword_text = keyword['keyword']
+                output_path = keyword['path']
+
+                if keyword_type in ('image', 'gif'):
+                    futures[index] = download_pool.submit(fetch_keyword, keyword_type, keyword_text, output_path)
+                elif keyword_type == 'text':
+                    if render_text:
+                        duration, reveal_time = keyword_timing(keyword)
+                        futures[index] = text_pool.submit(render_text_keyword, keyword_text, output_path,
+                                                          duration, reveal_time)
+                else:
+                    print(f"Unknown type '{keyword_type}' for keyword: {keyword_text}")
+
+            # Errors propagate like they do in the sequential path
+            for index, future in futures.items():
+                results[index] = future.result()
+    finally:
+        if text_pool is not None:
+            text_pool.shutdown()
+
+    return results
+
+
+def process_keyword(keyword, render_text=True):
+    """Download or render the media for a single mapped keyword"""
+    keyword_type = keyword['type']
+    keyword_text = keyword['keyword']
+    output_path = keyword['path']
+
+    # Call the appropriate function based on the type
+    if keyword_type in ('image', 'gif'):
+        return fetch_keyword(keyword_type, keyword_text, output_path)
+    elif keyword_type == 'text':
+        if not render_text:
+            return None
+        duration, reveal_time = keyword_timing(keyword)
+        return render_text_keyword(keyword_text, output_path, duration, reveal_time)
+    else:
+        print(f"Unknown type '{keyword_type}' for keyword: {keyword_text}")
+        return None
 
 if __name__ == "__main__":
     json_path = 'mapped.json'
-    search_and_save_by_type(json_path)
\ No newline at end of file
+    search_and_save_by_type(json_path)
@@ -1,68 +1,93 @@
 import json
 import os
-import re
 
-def transcript_to_sentences(file_path):
+from jobcontext import DEFAULT_JOB
+
+# A word ending in one of these closes its sentence, like splitting the text on them
+SENTENCE_END = ('.', '!', '?')
+
+
+class SentenceSegmenter:
+    """
+    Incremental sentence segmentation over word records.
+
+    Feed transcript words ({"word", "start", "end"}) one at a time with add(), e.g.
+    from a live transcriber callback. add() returns the finished sentence, with
+    its id and timings, as soon as a word ends it; flush() returns the last,
+    unterminated sentence once the words run out.
+    """
+
+    def __init__(self, start_id=1):
+        self.next_id = start_id
+        self.words = []
+
+    def add(self, word):
+        self.words.append(word)
+        if word["word"].endswith(SENTENCE_END):
+            return self.flush()
+        return None
+
+    def flush(self):
+        words = [word for word in self.words if word["word"].strip()]
+        self.words = []
+        if not words:
+            return None
+
+        sentence = {
+            "sentence": " ".join(word["word"].strip() for word in words),
+            "start": words[0]["start"],
+            "end": words[-1]["end"],
+            "id": self.next_id,
+        }
+        self.next_id += 1
+        return sentence
+
+
+def iter_sentences(words, start_id=1):
+    """
+    Generator over finished sentences for an iterable of word records, yielding
+    each sentence as soon as its last word arrives, so keyword extraction can
+    start while the rest of the audio is still being transcribed.
+    """
+    segmenter = SentenceSegmenter(start_id)
+    for word in words:
+        sentence = segmenter.add(word)
+        if sentence is not None:
+            yield sentence
+    sentence = segmenter.flush()
+    if sentence is not None:
+        yield sentence
+
+
+def transcript_to_sentences(file_path, job=None):
     """
     Converts a word-by-word transcript into a sentence-by-sentence transcript and adds primary IDs.
 
     Args:
         file_path (str): The path to the input transcript JSON file.
+        job (JobContext): Workspace to write the output to, defaults to the output folder.
 
     Returns:
         str: The path to the output JSON file with sentence-level transcripts including primary IDs.
     """
+    job = job or DEFAULT_JOB
+
     # Ensure the output directory exists
-    output_dir = "output"
+    output_dir = job.root
     os.makedirs(output_dir, exist_ok=True)
     
     # Read the transcript JSON file
     with open(file_path, 'r', encoding='utf-8') as file:
         data = json.load(file)
     
-    text = data.get("text", "")
-    words = data.get("words", [])
-    
-    # Split the text into sentences using punctuation
-    sentences = re.split(r'(?<=[.!?])\s+', text)
-    
-    sentence_transcripts = []
-    sentence_start_index = 0
-    
-    # Match sentences with timestamps
-    for sentence in sentences:
-        sentence = sentence.strip()
-        if not sentence:
-            continue
-        
-        sentence_start_time = words[sentence_start_index]["start"]
-        sentence_end_time = None
-        
-        word_count = len(sentence.split())
-        sentence_words = words[sentence_start_index:sentence_start_index + word_count]
-        
-        # Adjust the end timestamp based on the last word in the sentence
-        if sentence_words:
-            sentence_end_time = sentence_words[-1]["end"]
-        
-        sentence_transcripts.append({
-            "sentence": sentence,
-            "start": sentence_start_time,
-            "end": sentence_end_time
-        })
-        
-        sentence_start_index += word_count
-    
-    # Add primary IDs to each sentence
-    for index, sentence in enumerate(sentence_transcripts, start=1):
-        sentence['id'] = index
+    # Sentences come straight from the timed words, so timings never drift from the text
+    sentence_transcripts = list(iter_sentences(data.get("words", [])))
     
     # Define the output file path
-    output_path = os.path.join(output_dir, "sentence_transcript_with_ids.json")
+    output_path = job.sentences_path
     
     # Save the sentence-level transcripts with IDs to a JSON file
     with open(output_path, 'w', encoding='utf-8') as json_file:
         json.dump(sentence_transcripts, json_file, ensure_ascii=False, indent=4)
     
     return output_path
-
@@ -0,0 +1,102 @@
+import os
+import sqlite3
+import threading
+
+# One instance per cache and process. The caches are shared by every job on the
+# box, so re-runs and other jobs skip the requests, downloads and syntheses
+# that were already done.
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def cache_enabled(variable):
+    """False when a cache is switched off in the environment, e.g. MEDIA_CACHE=off"""
+    return os.getenv(variable, "on").lower() not in ("off", "0", "false")
+
+
+def get_cache(cls, name, default_dir, ttl, max_bytes):
+    """
+    Process wide cls instance for the cache called name (e.g. "MEDIA"), or None
+    when it is disabled with MEDIA_CACHE=off. MEDIA_CACHE_DIR and
+    MEDIA_CACHE_MAX_BYTES override default_dir and max_bytes.
+    """
+    if not cache_enabled(f"{name}_CACHE"):
+        return None
+    with _caches_lock:
+        cache = _caches.get(name)
+        if cache is None:
+            root = os.getenv(f"{name}_CACHE_DIR", default_dir)
+            max_bytes = int(os.getenv(f"{name}_CACHE_MAX_BYTES", max_bytes))
+            cache = _caches[name] = cls(root, ttl=ttl, max_bytes=max_bytes)
+        return cache
+
+
+class SqliteLRUCache:
+    """
+    Base for the on-disk caches: a sqlite index under root shared by concurrent
+    jobs, hit/miss/eviction counters, and least recently used eviction once the
+    cached data exceeds max_bytes.
+
+    Subclasses pass the CREATE TABLE statements for their entries and implement
+    lru_units (evictable units with their size, least recently used first),
+    drop_unit and usage (number of entries and bytes).
+    """
+
+    def __init__(self, root, db_name, schema, ttl, max_bytes):
+        self.root = root
+        self.db_path = os.path.join(root, db_name)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        os.makedirs(root, exist_ok=True)
+        with self.connect() as db:
+            for statement in schema:
+                db.execute(statement)
+            db.execute("CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER)")
+
+    def connect(self):
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def count(self, db, name):
+        db.execute(
+            "INSERT INTO stats (name, value) VALUES (?, 1) ON CONFLICT(name) DO UPDATE SET value = value + 1",
+            (name,)
+        )
+
+    def expired(self, created, now):
+        return now - created > self.ttl
+
+    def lru_units(self, db):
+        raise NotImplementedError
+
+    def drop_unit(self, db, unit):
+        raise NotImplementedError
+
+    def usage(self, db):
+        raise NotImplementedError
+
+    def evict(self):
+        """Drop least recently used units until they fit in max_bytes"""
+        with self.connect() as db:
+            units = self.lru_units(db)
+            total = sum(size for _, size in units)
+            for unit, size in units:
+                if total <= self.max_bytes:
+                    break
+                self.drop_unit(db, unit)
+                total -= size
+                self.count(db, "evictions")
+
+    def stats(self):
+        """Hit/miss/eviction counters plus the current number of entries and bytes"""
+        with self.connect() as db:
+            stats = dict(db.execute("SELECT name, value FROM stats").fetchall())
+            entries, size = self.usage(db)
+        hits, misses = stats.get("hits", 0), stats.get("misses", 0)
+        return {
+            "hits": hits,
+            "misses": misses,
+            "evictions": stats.get("evictions", 0),
+            "hit_rate": hits / (hits + misses) if hits + misses else 0,
+            "entries": entries,
+            "bytes": size,
+        }
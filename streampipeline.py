@@ -0,0 +1,123 @@
+import json
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from jobcontext import DEFAULT_JOB
+from keywordcollector import iter_sentence_keywords
+from mapping import KeywordMapper
+from searchbytype import DOWNLOAD_WORKERS, fetch_keyword, process_keyword
+
+# Marks the end of a stage's output on its queue
+_DONE = object()
+
+
+def run_streaming_pipeline(job=None, queue_size=8, download_workers=DOWNLOAD_WORKERS, render_text=False):
+    """
+    Extract keywords, map them and fetch their media as an overlapped pipeline.
+
+    A producer thread extracts keywords sentence by sentence, a mapper thread
+    maps each keyword to the transcript as soon as it arrives and the calling
+    thread hands image and GIF keywords to a download pool right away. Bounded
+    queues connect the stages, so wall time approaches the slowest stage instead
+    of the sum of all of them.
+
+    Writes the job's keywords.json and mapped.json exactly like process_json_file
+    and map_keywords_and_timestamps would, and returns the mapped entries. Text
+    keywords need the final end times, so with render_text they are rendered once
+    mapping has finished.
+    """
+    job = job or DEFAULT_JOB
+
+    with open(job.sentences_path, 'r') as file:
+        sentences = json.load(file)
+    with open(job.transcript_path, 'r') as file:
+        words_list = json.load(file).get('words', [])
+
+    keyword_queue = queue.Queue(maxsize=queue_size)
+    media_queue = queue.Queue(maxsize=queue_size)
+    keywords_data = []
+    errors = []
+    mapper = KeywordMapper(words_list, job)
+
+    def extract_keywords():
+        try:
+            for _, keywords in iter_sentence_keywords(sentences):
+                keywords_data.extend(keywords)
+                keyword_queue.put(keywords)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            keyword_queue.put(_DONE)
+
+    def map_keywords():
+        try:
+            while True:
+                keywords = keyword_queue.get()
+                if keywords is _DONE:
+                    break
+                for keyword_entry in keywords:
+                    combined_entry = mapper.add(keyword_entry)
+                    if combined_entry is not None:
+                        media_queue.put(combined_entry)
+        except Exception as e:
+            errors.append(e)
+            # Keep draining so the producer never blocks on a full queue
+            while keyword_queue.get() is not _DONE:
+                pass
+        finally:
+            media_queue.put(_DONE)
+
+    threads = [
+        threading.Thread(target=extract_keywords, name="keywords", daemon=True),
+        threading.Thread(target=map_keywords, name="mapping", daemon=True),
+    ]
+    for thread in threads:
+        thread.start()
+
+    # Bound the downloads in flight so backpressure reaches the queues
+    in_flight = threading.BoundedSemaphore(download_workers * 2)
+
+    def fetch(entry):
+        try:
+            return fetch_keyword(entry['type'], entry['keyword'], entry['path'])
+        finally:
+            in_flight.release()
+
+    futures = []
+    with ThreadPoolExecutor(max_workers=download_workers) as download_pool:
+        while True:
+            entry = media_queue.get()
+            if entry is _DONE:
+                break
+            if entry['type'] in ('image', 'gif'):
+                in_flight.acquire()
+                futures.append(download_pool.submit(fetch, entry))
+
+        for future in futures:
+            try:
+                future.result()
+            except Exception as e:
+                print(f"Error fetching media: {e}")
+
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+
+    # Post-processing adjustments need every keyword
+    combined_data = mapper.finalize()
+
+    if render_text:
+        for entry in combined_data:
+            if entry['type'] == 'text':
+                process_keyword(entry, render_text=True)
+
+    os.makedirs(job.root, exist_ok=True)
+    with open(job.keywords_path, "w") as output_file:
+        json.dump(keywords_data, output_file, indent=4)
+    with open(job.mapped_path, 'w') as f:
+        json.dump(combined_data, f, indent=2)
+
+    return combined_data
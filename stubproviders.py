@@ -0,0 +1,140 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+# Keep stub assets out of the shared media cache, so every run goes through the
+# stub server; must be set before searchandsave reads it
+STUB_CACHE_DIR = tempfile.mkdtemp(prefix="stub_media_cache_")
+os.environ["MEDIA_CACHE_DIR"] = STUB_CACHE_DIR
+
+import ratelimit
+import searchandsave
+
+# Local stand-in for Unsplash, Google Custom Search and Tenor, used to exercise
+# search_and_save_batch without API keys or network access.
+#
+#   python stubproviders.py
+
+
+class StubProviderHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, so connection reuse is visible
+    latency = 0.05
+    slow_latency = 1.0
+    throttle_every = 7  # every nth search request is answered with a 429
+    connections = set()
+    requests_served = 0
+    lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_body(self, body, content_type, status=200):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        with StubProviderHandler.lock:
+            StubProviderHandler.connections.add(self.client_address)
+            StubProviderHandler.requests_served += 1
+            served = StubProviderHandler.requests_served
+        time.sleep(self.latency)
+
+        url = urlsplit(self.path)
+        if not url.path.startswith("/assets/") and served % self.throttle_every == 0:
+            self.send_response(429)
+            self.send_header("Retry-After", "0.2")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        query = parse_qs(url.query)
+        base = f"http://{self.headers['Host']}"
+
+        if url.path == "/unsplash/search/photos":
+            term = query.get("query", [""])[0]
+            if term.startswith("slow"):
+                # Slow Unsplash responses, which hedged lookups answer from Google
+                time.sleep(self.slow_latency)
+            if term.startswith("missing"):
+                payload = {"results": []}
+            else:
+                payload = {"results": [{"urls": {"regular": f"{base}/assets/{term}.jpg"}}]}
+            self.send_body(json.dumps(payload).encode(), "application/json")
+        elif url.path == "/google/customsearch/v1":
+            term = query.get("q", [""])[0]
+            payload = {"items": [{"link": f"{base}/assets/google-{term}.jpg"}]}
+            self.send_body(json.dumps(payload).encode(), "application/json")
+        elif url.path == "/tenor/v2/search":
+            term = query.get("q", [""])[0]
+            payload = {"results": [{"media_formats": {"mp4": {"url": f"{base}/assets/{term}.mp4"}}}]}
+            self.send_body(json.dumps(payload).encode(), "application/json")
+        elif url.path.startswith("/assets/"):
+            # Deterministic content derived from the asset name
+            self.send_body(url.path.encode() * 1024, "application/octet-stream")
+        else:
+            self.send_body(b"not found", "text/plain", status=404)
+
+
+def start_stub_server():
+    """Start the stub providers on a free local port and point searchandsave at them"""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubProviderHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+
+    searchandsave.UNSPLASH_SEARCH_URL = f"{base}/unsplash/search/photos"
+    searchandsave.GOOGLE_SEARCH_URL = f"{base}/google/customsearch/v1"
+    searchandsave.TENOR_SEARCH_URL = f"{base}/tenor/v2/search"
+    searchandsave.google_api_key = searchandsave.google_api_key or "stub"
+    searchandsave.search_engine_id = searchandsave.search_engine_id or "stub"
+    # The real quotas would make a local run needlessly slow
+    for provider in ("unsplash", "google", "tenor"):
+        ratelimit.RATE_LIMITS[provider] = (50.0, 8)
+    return server
+
+
+def main(keyword_count=40, max_workers=8):
+    server = start_stub_server()
+    output_dir = tempfile.mkdtemp(prefix="stub_media_")
+    try:
+        types = ["image", "gif", "image", "missing", "slow"]
+        entries = []
+        for i in range(keyword_count):
+            kind = types[i % len(types)]
+            entries.append({
+                "order_id": i + 1,
+                "type": "gif" if kind == "gif" else "image",
+                # "missing" keywords have no Unsplash result and fall back to Google
+                "keyword": f"{kind}{i}",
+                "path": os.path.join(output_dir, f"{i + 1}.{'mp4' if kind == 'gif' else 'jpg'}"),
+            })
+
+        start = time.perf_counter()
+        results = searchandsave.search_and_save_batch(entries, max_workers=max_workers)
+        elapsed = time.perf_counter() - start
+
+        saved = [path for path in results if path and os.path.exists(path)]
+        fallbacks = [path for path, entry in zip(results, entries) if entry["keyword"].startswith("missing") and path]
+        print(f"Saved {len(saved)}/{len(entries)} files ({len(fallbacks)} via Google fallback) in {elapsed:.2f}s")
+        print(f"{StubProviderHandler.requests_served} requests over {len(StubProviderHandler.connections)} connections")
+        for provider, stats in sorted(searchandsave.download_stats().items()):
+            print(f"  {provider}: {stats['files']} files, {stats['bytes']} bytes, {stats['bytes_per_sec'] / 1e6:.1f} MB/s, "
+                  f"{stats['rejected']} rejected, {stats['cancelled']} cancelled")
+        for provider, stats in sorted(searchandsave.latency_percentiles().items()):
+            print(f"  {provider} lookups: {stats['count']}, p50 {stats['p50']:.2f}s, p90 {stats['p90']:.2f}s, p99 {stats['p99']:.2f}s")
+        assert len(saved) == len(entries)
+    finally:
+        server.shutdown()
+        shutil.rmtree(output_dir, ignore_errors=True)
+        shutil.rmtree(STUB_CACHE_DIR, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
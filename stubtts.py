@@ -0,0 +1,155 @@
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from moviepy.config import get_setting
+
+import chunkedtts
+import ratelimit
+import sqlitecache
+
+# Local stand-in for the ElevenLabs and Play.ht backends, used to check chunked
+# synthesis and the sentence cache without API keys: every chunk becomes a
+# deterministic tone whose pitch comes from its text and whose length grows
+# with its word count.
+#
+#   python stubtts.py
+
+SCRIPT = """
+Every week a new JavaScript framework promises to fix everything the last one broke. And every week we rewrite our todo app to prove it!
+
+Is that progress? Maybe. The bundle got bigger, the build got slower, and the todo app still has one feature.
+
+So here is the takeaway. Pick the boring tool, ship the thing, and let somebody else rewrite it next week.
+"""
+
+
+class FakeTTSError(Exception):
+    status_code = 503
+
+
+class FakeTTS:
+    """Deterministic fake TTS; every failing_every-th request fails with a 503"""
+
+    def __init__(self, codec="libmp3lame", sample_rate=44100, latency=0.3, failing_every=3):
+        self.codec = codec
+        self.sample_rate = sample_rate
+        self.latency = latency
+        self.failing_every = failing_every
+        self.calls = 0
+        self.failed = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, text, path):
+        digest = hashlib.sha256(text.encode()).digest()
+        with self.lock:
+            self.calls += 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            fail = self.calls % self.failing_every == 0
+            if fail:
+                self.failed += 1
+        try:
+            time.sleep(self.latency)
+            if fail:
+                raise FakeTTSError("service unavailable")
+            frequency = 200 + digest[1] * 2
+            duration = 0.05 * len(text.split())
+            command = [
+                get_setting("FFMPEG_BINARY"), '-y', '-loglevel', 'error',
+                '-f', 'lavfi', '-i', f"sine=frequency={frequency}:sample_rate={self.sample_rate}:duration={duration}",
+                '-ac', '1', '-c:a', self.codec, '-f', 'mp3' if self.codec == 'libmp3lame' else 'wav',
+                path
+            ]
+            subprocess.run(command, check=True)
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+
+def check_backend(name, extension, tts, workers=3, max_chars=120):
+    temp_dir = tempfile.mkdtemp(prefix="stub_tts_")
+    try:
+        output_path = os.path.join(temp_dir, f"audio.{extension}")
+        chunks_path = os.path.join(temp_dir, "audio_chunks.json")
+
+        start = time.perf_counter()
+        chunkedtts.generate_chunked_audio(SCRIPT, output_path, tts, name, workers=workers,
+                                          chunks_path=chunks_path, extension=extension, max_chars=max_chars)
+        elapsed = time.perf_counter() - start
+
+        with open(chunks_path, 'r', encoding='utf-8') as f:
+            chunks = json.load(f)
+        output = chunkedtts.decode_pcm(output_path)
+        total = len(output) / (chunkedtts.SAMPLE_BYTES * chunkedtts.SAMPLE_RATE)
+        expected = chunks[-1]["offset"] + chunks[-1]["duration"]
+
+        # Offsets are contiguous, so nothing is lost or inserted between chunks
+        for previous, chunk in zip(chunks, chunks[1:]):
+            assert abs(previous["offset"] + previous["duration"] - chunk["offset"]) < 1e-9
+        assert abs(total - expected) < 0.03, (total, expected)
+
+        # A second run synthesizes the same audio
+        again_path = os.path.join(temp_dir, f"again.{extension}")
+        chunkedtts.generate_chunked_audio(SCRIPT, again_path, tts, name, workers=workers,
+                                          extension=extension, max_chars=max_chars)
+        assert chunkedtts.decode_pcm(again_path) == output
+
+        print(f"{name}: {len(chunks)} chunks in {elapsed:.2f}s, {total:.3f}s of audio "
+              f"(chunks add up to {expected:.3f}s), {tts.calls} requests, {tts.failed} retried, "
+              f"at most {tts.peak_in_flight} at once")
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def check_cache(name, extension, tts, workers=3, max_chars=0):
+    """Edit one sentence and check that only its sentence (or packed chunk) is synthesized again"""
+    temp_dir = tempfile.mkdtemp(prefix="stub_tts_cache_")
+    os.environ["TTS_CACHE_DIR"] = os.path.join(temp_dir, "cache")
+    sqlitecache._caches.pop("TTS", None)
+    try:
+        voice_settings = {"voice_id": "stub", "model_id": "stub"}
+        edited = SCRIPT.replace("one feature", "exactly one feature")
+        output_path = os.path.join(temp_dir, f"audio.{extension}")
+
+        chunkedtts.generate_chunked_audio(SCRIPT, output_path, tts, name, workers=workers, max_chars=max_chars,
+                                          extension=extension, voice_settings=voice_settings)
+        first = tts.calls - tts.failed
+        chunkedtts.generate_chunked_audio(edited, output_path, tts, name, workers=workers, max_chars=max_chars,
+                                          extension=extension, voice_settings=voice_settings)
+        second = tts.calls - tts.failed - first
+        assert second == 1, second
+
+        # Reused chunks stitch to the same audio as synthesizing the edit from scratch
+        fresh_path = os.path.join(temp_dir, f"fresh.{extension}")
+        chunkedtts.generate_chunked_audio(edited, fresh_path, tts, name, workers=workers,
+                                          extension=extension, max_chars=max_chars)
+        assert chunkedtts.decode_pcm(fresh_path) == chunkedtts.decode_pcm(output_path)
+
+        unit = "sentences" if max_chars == 0 else "chunks"
+        print(f"{name} cache: {first} {unit} synthesized, {second} after editing one sentence, "
+              f"{chunkedtts.get_tts_cache().stats()['entries']} cached")
+    finally:
+        sqlitecache._caches.pop("TTS", None)
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def main():
+    ratelimit.BACKOFF_BASE = 0.1
+    for provider in ("elevenlabs", "playht"):
+        ratelimit.RATE_LIMITS[provider] = (50.0, 8)
+    check_backend("elevenlabs", "mp3", FakeTTS("libmp3lame", 44100))
+    check_backend("playht", "wav", FakeTTS("pcm_s16le", 24000))
+    check_cache("elevenlabs", "mp3", FakeTTS("libmp3lame", 44100))
+    check_cache("playht", "wav", FakeTTS("pcm_s16le", 24000))
+    check_cache("elevenlabs", "mp3", FakeTTS("libmp3lame", 44100), max_chars=chunkedtts.CHUNK_CHARS)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,7 +2,10 @@ import os
 import pygame
 import shutil
 import random
-from moviepy.editor import ImageSequenceClip
+import tempfile
+import numpy as np
+from moviepy.editor import ImageSequenceClip, VideoClip
+from moviepy.video.io.ffmpeg_writer import FFMPEG_VideoWriter
 
 # Initialize Pygame
 pygame.init()
@@ -20,6 +23,32 @@ COLORS = [
     (94, 255, 247),     # Bright Cyan
 ]
 
+# Fonts and rendered glyphs shared by every TextEffect in this process
+_FONT_CACHE = {}   # font_size -> pygame.font.Font
+_GLYPH_CACHE = {}  # (font_size, char, color) -> rendered glyph surface
+
+def get_font(font_size):
+    """Return a cached default font for the given size"""
+    font = _FONT_CACHE.get(font_size)
+    if font is None:
+        font = pygame.font.Font(None, font_size)
+        _FONT_CACHE[font_size] = font
+    return font
+
+def get_glyph(font_size, char, color):
+    """Return a cached rendered surface for a single character"""
+    key = (font_size, char, tuple(color))
+    glyph = _GLYPH_CACHE.get(key)
+    if glyph is None:
+        glyph = get_font(font_size).render(char, True, color)
+        _GLYPH_CACHE[key] = glyph
+    return glyph
+
+def clear_text_caches():
+    """Drop all cached fonts and glyphs"""
+    _FONT_CACHE.clear()
+    _GLYPH_CACHE.clear()
+
 class TextEffect:
     def __init__(self, word, resolution, font_color, bg_color):
         self.word = word
@@ -33,6 +62,12 @@ class TextEffect:
         # Apply zoom effect only for short words (less than 5 characters)
         self.apply_zoom = len(word) < 5
 
+        # (revealed_text, font_size) -> list of (glyph surface, position) blits
+        self._layout_cache = {}
+        # font_size -> zoomed word surface scaled from one full size render
+        self._zoom_cache = {}
+        self._zoom_source = None
+
         print(f"Creating video for word: {word} (length: {len(word)}) with base font size: {self.base_font_size}")
         print(f"Font color: RGB{self.color}, Background: RGB{self.bg_color}")
         print(f"Zoom effect: {'enabled' if self.apply_zoom else 'disabled'}")
@@ -68,6 +103,18 @@ class TextEffect:
 
         return int(self.base_font_size * scale)
     
+    def revealed_text_at(self, frame_index, fps, reveal_time):
+        """Return the part of the word visible at a frame index"""
+        # Only longer words are revealed letter by letter
+        if len(self.word) < 5:
+            return self.word
+
+        reveal_frames = int(fps * reveal_time)
+        if frame_index >= reveal_frames:
+            return self.word
+        letters_per_frame = len(self.word) / reveal_frames
+        return self.word[:min(len(self.word), int(frame_index * letters_per_frame))]
+
     def wrap_text(self, text, font, max_width):
         """Wrap text into multiple lines to fit within max_width"""
         lines = []
@@ -96,6 +143,62 @@ class TextEffect:
 
         return lines
     
+    def layout_text(self, revealed_text, font_size):
+        """Compute (and cache) the glyph blits for the revealed text at a font size"""
+        key = (revealed_text, font_size)
+        blits = self._layout_cache.get(key)
+        if blits is not None:
+            return blits
+
+        font = get_font(font_size)
+        lines = self.wrap_text(revealed_text, font, self.resolution[0] * 0.9)  # 90% of screen width
+        total_height = len(lines) * font_size
+        y_offset = (self.resolution[1] - total_height) // 2  # Center vertically
+        space_width = font.size(" ")[0]  # Get the width of a space character
+
+        blits = []
+        for line in lines:
+            # Calculate total width of the line (including spaces)
+            glyphs = [None if not char.strip() else get_glyph(font_size, char, self.color) for char in line]
+            total_width = sum(space_width if glyph is None else glyph.get_width() for glyph in glyphs)
+
+            # Calculate starting x position for centering
+            x_offset = (self.resolution[0] - total_width) // 2
+
+            for glyph in glyphs:
+                if glyph is None:
+                    # Add space width
+                    x_offset += space_width
+                else:
+                    blits.append((glyph, (x_offset, y_offset)))
+                    x_offset += glyph.get_width()
+
+            # Move to the next line
+            y_offset += font_size
+
+        self._layout_cache[key] = blits
+        return blits
+
+    def zoomed_word(self, font_size):
+        """Scale one full size render of the word to the requested font size"""
+        text_surface = self._zoom_cache.get(font_size)
+        if text_surface is not None:
+            return text_surface
+
+        if self._zoom_source is None:
+            self._zoom_source = get_font(self.base_font_size).render(self.word, True, self.color)
+
+        if font_size == self.base_font_size:
+            text_surface = self._zoom_source
+        else:
+            scale = font_size / self.base_font_size
+            width = max(1, int(self._zoom_source.get_width() * scale))
+            height = max(1, int(self._zoom_source.get_height() * scale))
+            text_surface = pygame.transform.smoothscale(self._zoom_source, (width, height))
+
+        self._zoom_cache[font_size] = text_surface
+        return text_surface
+
     def render_frame(self, revealed_text, t):
         """Render a single frame with text wrapping for paragraphs"""
         surface = pygame.Surface(self.resolution)
@@ -103,11 +206,10 @@ class TextEffect:
 
         # Calculate dynamic font size with zoom effect (if applicable)
         font_size = self.apply_zoom_effect(t)
-        font = pygame.font.Font(None, font_size)
 
         if self.apply_zoom:
             # For short words: render the full word with zoom effect
-            text_surface = font.render(self.word, True, self.color)
+            text_surface = self.zoomed_word(font_size)
             
             # Calculate centered position
             text_x = (self.resolution[0] - text_surface.get_width()) // 2
@@ -115,52 +217,97 @@ class TextEffect:
             
             surface.blit(text_surface, (text_x, text_y))
         else:
-            # For longer text: split into lines and render
-            lines = self.wrap_text(revealed_text, font, self.resolution[0] * 0.9)  # 90% of screen width
-            total_height = len(lines) * font_size
-            y_offset = (self.resolution[1] - total_height) // 2  # Center vertically
-
-            for line in lines:
-                # Calculate total width of the line (including spaces)
-                total_width = 0
-                char_surfaces = []
-                space_width = font.size(" ")[0]  # Get the width of a space character
-
-                for char in line:
-                    if char.strip():  # If it's not a space
-                        char_surface = font.render(char, True, self.color)
-                        char_surfaces.append((char_surface, False))  # False = not a space
-                        total_width += char_surface.get_width()
-                    else:  # If it's a space
-                        char_surfaces.append((None, True))  # True = space
-                        total_width += space_width
-                
-                # Calculate starting x position for centering
-                x_offset = (self.resolution[0] - total_width) // 2
-
-                # Render each character or space
-                for char_surface, is_space in char_surfaces:
-                    if is_space:
-                        # Add space width
-                        x_offset += space_width
-                    else:
-                        # Render character
-                        surface.blit(char_surface, (x_offset, y_offset))
-                        x_offset += char_surface.get_width()
-                
-                # Move to the next line
-                y_offset += font_size
+            # For longer text: blit the cached glyph layout
+            surface.blits(self.layout_text(revealed_text, font_size), doreturn=False)
             
         return surface
 
-def create_text_video(word, temp_folder="temp_frames",output_path="output/video/text.mp4",
+def surface_to_frame(surface):
+    """Convert a pygame surface into an RGB numpy frame of shape (height, width, 3)"""
+    width, height = surface.get_size()
+    buffer = pygame.image.tostring(surface, "RGB")
+    return np.frombuffer(buffer, dtype=np.uint8).reshape((height, width, 3))
+
+def text_frame_runs(effect, duration, reveal_time, fps=24):
+    """
+    Yield (revealed_text, t, hold) for each run of identical frames in a text clip.
+
+    Consecutive frames with the same revealed text and zoom font size are
+    pixel-identical, so each run only needs to be rendered once and held for
+    `hold` frames. The runs always add up to int(fps * duration) frames.
+    """
+    total_frames = int(fps * duration)
+
+    run = None
+    for i in range(total_frames):
+        t = i / fps
+        revealed_text = effect.revealed_text_at(i, fps, reveal_time)
+
+        key = (revealed_text, effect.apply_zoom_effect(t))
+        if run is not None and run[0] == key:
+            run[3] += 1
+        else:
+            if run is not None:
+                yield run[1], run[2], run[3]
+            run = [key, revealed_text, t, 1]
+
+    if run is not None:
+        yield run[1], run[2], run[3]
+
+def fit_surface(surface, height, canvas_color=(0, 0, 0)):
+    """Scale a surface to the given height and center it on a canvas of the original size"""
+    width = round(surface.get_width() * height / surface.get_height())
+    scaled = pygame.transform.smoothscale(surface, (width, height))
+    canvas = pygame.Surface(surface.get_size())
+    canvas.fill(canvas_color)
+    canvas.blit(scaled, ((canvas.get_width() - width) // 2, (canvas.get_height() - height) // 2))
+    return canvas
+
+def make_text_clip(word, duration, resolution=(1920, 1080), font_color=None,
+                   bg_color=(0, 0, 0), reveal_time=1, fps=24, fit_height=None):
+    """
+    Build a procedural moviepy VideoClip for a text keyword.
+
+    Frames are rendered lazily by TextEffect when the clip is composited, so the
+    keyword never goes through an intermediate mp4. The clip can be given any
+    duration; after the reveal the full word is simply held.
+
+    With fit_height each unique frame is scaled down to that height and centered
+    on a black full resolution canvas once, so the composer never has to resize it.
+    """
+    effect = TextEffect(word, resolution, font_color, bg_color)
+    last = {"key": None, "frame": None}
+
+    def make_frame(t):
+        frame_index = int(t * fps + 1e-6)
+        revealed_text = effect.revealed_text_at(frame_index, fps, reveal_time)
+        key = (revealed_text, effect.apply_zoom_effect(t))
+        # Held frames reuse the previous render
+        if key != last["key"]:
+            surface = effect.render_frame(revealed_text, t)
+            if fit_height:
+                surface = fit_surface(surface, fit_height)
+            last["frame"] = surface_to_frame(surface)
+            last["key"] = key
+        return last["frame"]
+
+    return VideoClip(make_frame, duration=duration)
+
+def create_text_video(word, temp_folder=None, output_path="output/video/text.mp4",
                      resolution=(1920, 1080), font_color=None, bg_color=(0, 0, 0),
-                     duration=5,reveal_time=1):
-    
+                     duration=5, reveal_time=1, stream=True):
+    """
+    Render the text effect for a word and encode it to output_path.
+
+    With stream=True (default) the raw RGB buffer of each frame is piped straight into
+    an ffmpeg writer, so no temporary files are created. With stream=False frames are
+    saved as PNGs in temp_folder (a fresh temporary directory when not given) and
+    encoded through ImageSequenceClip.
+    """
     # Create all necessary directories in the path
     output_dir = os.path.dirname(output_path)
-    os.makedirs(output_dir, exist_ok=True)
-    os.makedirs(temp_folder, exist_ok=True)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
 
     # Make sure the output file doesn't exist or isn't in use
     if os.path.exists(output_path):
@@ -173,57 +320,55 @@ def create_text_video(word, temp_folder="temp_frames",output_path="output/video/
     fps = 24
     effect = TextEffect(word, resolution, font_color, bg_color)
 
-    frames = []
-    total_frames = int(fps * duration)
-    
-    # Calculate reveal duration (only for longer words)
-    reveal_frames = int(fps * reveal_time) if len(word) >= 5 else 0
-    letters_per_frame = len(word) / reveal_frames if reveal_frames > 0 else 0
+    if stream:
+        # Pipe raw RGB frames into ffmpeg, no intermediate files. Held frames are
+        # rendered once and the same buffer is written for every repeat.
+        writer = FFMPEG_VideoWriter(output_path, resolution, fps, codec="libx264")
+        try:
+            for revealed_text, t, hold in text_frame_runs(effect, duration, reveal_time, fps):
+                frame = surface_to_frame(effect.render_frame(revealed_text, t))
+                for _ in range(hold):
+                    writer.write_frame(frame)
+        finally:
+            writer.close()
+        return output_path
 
-    for i in range(total_frames):
-        t = i / fps
-        
-        # Calculate revealed text (only for longer words)
-        if len(word) >= 5:
-            if i < reveal_frames:
-                revealed_count = min(len(word), int(i * letters_per_frame))
-            else:
-                revealed_count = len(word)
-            revealed_text = word[:revealed_count]
-        else:
-            # For short words, always show the full word
-            revealed_text = word
-        
-        # Render frame
-        surface = effect.render_frame(revealed_text, t)
-        frame_path = os.path.join(temp_folder, f"frame_{i:04d}.png")
-        pygame.image.save(surface, frame_path)
-        frames.append(frame_path)
+    # Use a private folder so parallel renders never share frames
+    if temp_folder is None:
+        temp_folder = tempfile.mkdtemp(prefix="temp_frames_")
+    else:
+        os.makedirs(temp_folder, exist_ok=True)
 
-    # Create video
-    clip = ImageSequenceClip(frames, fps=fps)
-    clip.write_videofile(output_path, codec="libx264", fps=fps)
+    frames = []
+    try:
+        for i, (revealed_text, t, hold) in enumerate(text_frame_runs(effect, duration, reveal_time, fps)):
+            # Save each unique frame once and reference it for the whole run
+            frame_path = os.path.join(temp_folder, f"frame_{i:04d}.png")
+            pygame.image.save(effect.render_frame(revealed_text, t), frame_path)
+            frames.extend([frame_path] * hold)
 
-    # Cleanup
-    for frame in frames:
-        os.remove(frame)
-    shutil.rmtree(temp_folder)
+        # Create video
+        clip = ImageSequenceClip(frames, fps=fps)
+        clip.write_videofile(output_path, codec="libx264", fps=fps)
+    finally:
+        # Cleanup
+        shutil.rmtree(temp_folder, ignore_errors=True)
 
     return output_path
 
 def create_video_for_single_keyword(word, output_path,
                                    resolution=(1920, 1080), font_color=None,
-                                   bg_color=(0, 0, 0), duration=5, reveal_time=1):
+                                   bg_color=(0, 0, 0), duration=5, reveal_time=1, stream=True):
     try:
         video_path = create_text_video(
             word,
-            temp_folder="temp_frames",
             output_path=output_path,
             resolution=resolution,
             font_color=font_color,
             bg_color=bg_color,
             duration=duration,
-            reveal_time=reveal_time
+            reveal_time=reveal_time,
+            stream=stream
         )
         print(f"Created video: {video_path}")
         return video_path
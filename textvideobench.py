@@ -0,0 +1,44 @@
+import time
+import pygame
+
+from textvideo import TextEffect, clear_text_caches
+
+# Micro-benchmark for TextEffect.render_frame with and without the glyph/layout caches
+
+KEYWORDS = {
+    "short": "AI",
+    "medium": "JavaScript frameworks",
+    "paragraph": (
+        "Every week a new JavaScript framework promises to fix everything the last one broke, "
+        "and every week we rewrite our todo app to prove it"
+    ),
+}
+
+def render_frames(effect, word, frames, fps=24, cached=True):
+    """Render a 1 second reveal followed by held frames and return frames/sec"""
+    start = time.perf_counter()
+    for i in range(frames):
+        t = i / fps
+        revealed_text = word if effect.apply_zoom else word[:min(len(word), int(i * len(word) / fps))]
+        if not cached:
+            # Simulate the old behaviour: nothing survives between frames
+            clear_text_caches()
+            effect._layout_cache.clear()
+            effect._zoom_cache.clear()
+            effect._zoom_source = None
+        effect.render_frame(revealed_text, t)
+    return frames / (time.perf_counter() - start)
+
+def main(frames=120, resolution=(1920, 1080)):
+    pygame.init()
+    print(f"{'keyword':<10} {'uncached fps':>14} {'cached fps':>12} {'speedup':>9}")
+    for name, word in KEYWORDS.items():
+        effect = TextEffect(word, resolution, (255, 255, 255), (0, 0, 0))
+        before = render_frames(effect, word, frames, cached=False)
+        clear_text_caches()
+        effect = TextEffect(word, resolution, (255, 255, 255), (0, 0, 0))
+        after = render_frames(effect, word, frames, cached=True)
+        print(f"{name:<10} {before:>14.1f} {after:>12.1f} {after / before:>8.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -3,7 +3,11 @@ from dotenv import load_dotenv
 import json
 import os
 
-def generate_transcript(audio_file_path):
+from jobcontext import DEFAULT_JOB
+from ratelimit import call_with_retry
+
+def generate_transcript(audio_file_path, job=None):
+    job = job or DEFAULT_JOB
     print("Generating Transcript ...")
     # Load environment variables
     load_dotenv()
@@ -32,7 +36,7 @@ def generate_transcript(audio_file_path):
 
     try:
         # Perform transcription
-        transcript = transcriber.transcribe(audio_file_path, config)
+        transcript = call_with_retry("assemblyai", transcriber.transcribe, audio_file_path, config)
 
         if transcript.status == aai.TranscriptStatus.error:
             raise Exception(f"Transcription failed: {transcript.error}")
@@ -51,7 +55,7 @@ def generate_transcript(audio_file_path):
         }
 
         # Save transcription result to a JSON file
-        transcript_path = "output/transcript.json"
+        transcript_path = job.transcript_path
         os.makedirs(os.path.dirname(transcript_path), exist_ok=True)
         with open(transcript_path, 'w') as json_file:
             json.dump(transcription_result, json_file, indent=4)
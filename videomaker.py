@@ -1,11 +1,22 @@
+import functools
 import json
+import os
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from moviepy.config import get_setting
 from moviepy.editor import ImageClip, VideoFileClip, concatenate_videoclips, AudioFileClip, CompositeVideoClip, ColorClip
 from moviepy.video.fx.all import freeze
+from textvideo import make_text_clip
+from ffmpegvideomaker import render_with_ffmpeg, frame_index
+from compositor import SequentialTimelineClip
+from resourcemonitor import ResourceMonitor
 
 # Define the resolution for the final video
 VIDEO_RESOLUTION = (1920, 1080)
 
-def create_clip(keyword_data):
+def create_clip(keyword_data, procedural_text=True):
     try:
         print(f"Loading file from: {keyword_data['path']}")
         start_sec = keyword_data['start'] / 1000
@@ -16,16 +27,31 @@ def create_clip(keyword_data):
             print(f"Invalid duration for {keyword_data['path']}: {duration}")
             return None
 
+        # Media normalized by normalize_media is already full frame
+        normalized_path = keyword_data.get('normalized_path')
+        fitted = normalized_path is not None
+
         if keyword_data['type'] == 'image':
-            clip = ImageClip(keyword_data['path']).set_duration(duration)
+            clip = ImageClip(normalized_path or keyword_data['path']).set_duration(duration)
             
         elif keyword_data['type'] == 'gif':
-            clip = VideoFileClip(keyword_data['path'])
+            clip = VideoFileClip(normalized_path or keyword_data['path'])
             if clip.duration < duration:
                 clip = clip.loop(duration=duration)
             else:
                 clip = clip.subclip(0, duration)
                 
+        elif keyword_data['type'] == 'text' and procedural_text:
+            # Render the text effect lazily at composite time, no intermediate file
+            clip = make_text_clip(
+                keyword_data['keyword'],
+                duration,
+                resolution=VIDEO_RESOLUTION,
+                reveal_time=duration / 5,
+                fit_height=VIDEO_RESOLUTION[1] - 40
+            )
+            fitted = True
+
         elif keyword_data['type'] == 'text':
             clip = VideoFileClip(keyword_data['path'])
             if clip.duration < duration:
@@ -44,68 +70,234 @@ def create_clip(keyword_data):
             raise ValueError(f"Unknown type: {keyword_data['type']}")
 
         # Resize and position the clip
-        clip = clip.resize(height=VIDEO_RESOLUTION[1] - 40).set_position('center')
+        if not fitted:
+            clip = clip.resize(height=VIDEO_RESOLUTION[1] - 40)
+        clip = clip.set_position('center')
         return clip
 
     except Exception as e:
         print(f"Error processing {keyword_data['path']}: {e}")
         return None
 
-def create_video(data, audio_path, output_path):
+def adjust_timeline(data, total_duration):
+    """Sort keywords by order_id and stretch each end to the next start so clips leave no gaps"""
+    sorted_keywords = sorted(data, key=lambda x: x['order_id'])
+    
+    # Adjust end times to eliminate gaps between clips
+    adjusted_data = []
+    for i in range(len(sorted_keywords)):
+        current = sorted_keywords[i]
+        if i < len(sorted_keywords) - 1:
+            next_kw = sorted_keywords[i + 1]
+            new_end = next_kw['start']
+        else:
+            new_end = current['end']
+        
+        # Ensure valid duration
+        new_end = max(new_end, current['start'])
+        if new_end > total_duration * 1000:
+            new_end = total_duration * 1000
+        
+        adjusted_kw = current.copy()
+        adjusted_kw['end'] = new_end
+        adjusted_data.append(adjusted_kw)
+
+    return adjusted_data
+
+def frame_bound(time_sec, fps, start_frame=0):
+    """
+    Segment local time of the first frame shown at or after time_sec, moved half
+    a frame earlier so no frame time lands on the bound through float rounding.
+    """
+    return (frame_index(time_sec, fps) - start_frame - 0.5) / fps
+
+def compose_clips(adjusted_data, duration, procedural_text=True, backend="timeline", start_frame=0, max_open=2,
+                  fps=24):
+    """
+    Build the composed video clip for the keywords of a timeline.
+
+    Keyword intervals are snapped to whole frames counted from start_frame, so a
+    segment of the timeline composed on its own starting at 0 shows the same
+    clip on every frame as the whole timeline does. Returns (final_clip, clips).
+
+    The timeline backend opens each clip lazily when its interval starts and
+    keeps at most max_open sources open, so clips is empty in that case.
+    """
+    if backend == "timeline":
+        # Sequential timeline: one active clip per frame over a black canvas
+        sources = [
+            (frame_bound(keyword['start'] / 1000, fps, start_frame),
+             frame_bound(keyword['end'] / 1000, fps, start_frame),
+             functools.partial(create_clip, keyword, procedural_text))
+            for keyword in adjusted_data
+        ]
+        final_clip = SequentialTimelineClip(sources, size=VIDEO_RESOLUTION, duration=duration, max_open=max_open)
+        return final_clip, []
+
+    clips = []
+    for keyword in adjusted_data:
+        clip = create_clip(keyword, procedural_text)
+        if clip is not None:
+            start_time = keyword['start'] / 1000
+            clip = clip.set_start(frame_bound(start_time, fps, start_frame))
+            clip = clip.set_end(frame_bound(keyword['end'] / 1000, fps, start_frame))
+            clips.append(clip)
+            print(f"Added {keyword['type']} clip {keyword['order_id']} at {start_time}s")
+
+    # Add black background covering full duration
+    background = ColorClip(
+        size=VIDEO_RESOLUTION,
+        color=(0, 0, 0),
+        duration=duration
+    )
+    clips.insert(0, background)
+
+    # Create final composition
+    final_clip = CompositeVideoClip(clips, size=VIDEO_RESOLUTION)
+
+    return final_clip, clips
+
+def split_timeline(adjusted_data, total_duration, segments, fps=24):
+    """
+    Split the timeline at keyword boundaries into roughly equal length segments.
+
+    Returns a list of (start_frame, end_frame, keywords) tuples covering every
+    frame of the video. Cut points are snapped to frames so segments join exactly.
+    """
+    # Same frame count moviepy writes for the whole audio duration
+    total_frames = frame_index(total_duration, fps)
+    starts = sorted({frame_index(keyword['start'] / 1000, fps) for keyword in adjusted_data} | {0})
+
+    # Pick the keyword start closest to each ideal cut
+    cuts = [0]
+    for k in range(1, segments):
+        target = total_frames * k / segments
+        cut = min(starts, key=lambda start: abs(start - target))
+        if cuts[-1] < cut < total_frames:
+            cuts.append(cut)
+    cuts.append(total_frames)
+
+    timeline = []
+    for start_frame, end_frame in zip(cuts, cuts[1:]):
+        keywords = [
+            keyword for keyword in adjusted_data
+            if start_frame <= frame_index(keyword['start'] / 1000, fps) < end_frame
+        ]
+        timeline.append((start_frame, end_frame, keywords))
+    return timeline
+
+def render_segment(keywords, start_frame, end_frame, output_path, procedural_text=True,
+                   backend="timeline", fps=24, max_open=2):
+    """Render one segment of the timeline without audio (runs in a worker process)"""
+    # Stop half a frame early so moviepy emits exactly end_frame - start_frame frames
+    duration = (end_frame - start_frame - 0.5) / fps
+    final_clip, clips = compose_clips(keywords, duration, procedural_text, backend, start_frame, max_open, fps)
+    final_clip.write_videofile(
+        output_path,
+        fps=fps,
+        audio=False,
+        preset='fast',
+        ffmpeg_params=['-crf', '28'],
+        logger=None
+    )
+    final_clip.close()
+    for clip in clips:
+        clip.close()
+    return output_path
+
+def render_segments_parallel(adjusted_data, audio_path, output_path, total_duration,
+                             segments, procedural_text=True, backend="timeline", fps=24, max_open=2):
+    """
+    Render the timeline as independent segments in parallel processes.
+
+    Every segment is encoded with the same settings and starts on a keyframe, so
+    ffmpeg's concat demuxer joins them without re-encoding. The narration audio
+    is muxed once at the end.
+    """
+    timeline = split_timeline(adjusted_data, total_duration, segments, fps)
+    temp_dir = tempfile.mkdtemp(prefix="segments_")
+    try:
+        segment_paths = [os.path.join(temp_dir, f"segment_{i:03d}.mp4") for i in range(len(timeline))]
+        print(f"Rendering {len(timeline)} segments in parallel...")
+        with ProcessPoolExecutor(max_workers=len(timeline)) as pool:
+            futures = [
+                pool.submit(render_segment, keywords, start_frame, end_frame, path,
+                            procedural_text, backend, fps, max_open)
+                for (start_frame, end_frame, keywords), path in zip(timeline, segment_paths)
+            ]
+            for future in futures:
+                future.result()
+
+        list_path = os.path.join(temp_dir, "segments.txt")
+        with open(list_path, 'w') as f:
+            for path in segment_paths:
+                f.write(f"file '{os.path.abspath(path)}'\n")
+
+        command = [
+            get_setting("FFMPEG_BINARY"), '-y', '-loglevel', 'error',
+            '-f', 'concat', '-safe', '0', '-i', list_path,
+            '-i', audio_path,
+            '-map', '0:v', '-map', '1:a',
+            '-c:v', 'copy', '-c:a', 'aac',
+            output_path
+        ]
+        result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        if result.returncode != 0:
+            raise RuntimeError(f"ffmpeg concat failed: {result.stderr.decode(errors='replace')}")
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+    return output_path
+
+def create_video(data, audio_path, output_path, procedural_text=True, backend="timeline", segments=1,
+                 max_open=2):
+    """
+    Compose the keyword clips over the narration audio into output_path.
+
+    backend="timeline" (default) looks up the single active clip per frame from an
+    interval index, backend="moviepy" composites every clip with CompositeVideoClip
+    and backend="ffmpeg" compiles the timeline into a single ffmpeg filtergraph.
+
+    With segments > 1 the timeline and moviepy backends split the video at keyword
+    boundaries, render the segments in parallel processes and concat them losslessly.
+
+    max_open bounds how many clip sources the timeline backend keeps open at once.
+    """
+    if backend not in ("timeline", "moviepy", "ffmpeg"):
+        raise ValueError(f"Unknown backend: {backend}")
+
     try:
         audio_clip = AudioFileClip(audio_path)
         total_duration = audio_clip.duration
-        sorted_keywords = sorted(data, key=lambda x: x['order_id'])
-        
-        # Adjust end times to eliminate gaps between clips
-        adjusted_data = []
-        for i in range(len(sorted_keywords)):
-            current = sorted_keywords[i]
-            if i < len(sorted_keywords) - 1:
-                next_kw = sorted_keywords[i + 1]
-                new_end = next_kw['start']
-            else:
-                new_end = current['end']
-            
-            # Ensure valid duration
-            new_end = max(new_end, current['start'])
-            if new_end > total_duration * 1000:
-                new_end = total_duration * 1000
-            
-            adjusted_kw = current.copy()
-            adjusted_kw['end'] = new_end
-            adjusted_data.append(adjusted_kw)
-
-        clips = []
-        for keyword in adjusted_data:
-            clip = create_clip(keyword)
-            if clip is not None:
-                start_time = keyword['start'] / 1000
-                clip = clip.set_start(start_time)
-                clips.append(clip)
-                print(f"Added {keyword['type']} clip {keyword['order_id']} at {start_time}s")
-
-        # Add black background covering full duration
-        background = ColorClip(
-            size=VIDEO_RESOLUTION,
-            color=(0, 0, 0),
-            duration=total_duration
-        )
-        clips.insert(0, background)
-
-        # Create final composition
-        final_clip = CompositeVideoClip(clips, size=VIDEO_RESOLUTION)
-        final_clip = final_clip.set_audio(audio_clip)
+        adjusted_data = adjust_timeline(data, total_duration)
+
+        if backend == "ffmpeg":
+            audio_clip.close()
+            render_with_ffmpeg(adjusted_data, audio_path, output_path, total_duration, VIDEO_RESOLUTION, fps=24)
+            return
+
+        if segments > 1:
+            audio_clip.close()
+            render_segments_parallel(adjusted_data, audio_path, output_path, total_duration,
+                                     segments, procedural_text, backend, fps=24, max_open=max_open)
+            return
+
+        composed_clip, clips = compose_clips(adjusted_data, total_duration, procedural_text, backend, max_open=max_open)
+        final_clip = composed_clip.set_audio(audio_clip)
         
         # Write output video
         print("Rendering final video...")
-        final_clip.write_videofile(
-            output_path,
-            fps=24,
-            threads=4,
-            preset='fast',
-            ffmpeg_params=['-crf', '28']
-        )
+        with ResourceMonitor() as monitor:
+            final_clip.write_videofile(
+                output_path,
+                fps=24,
+                threads=4,
+                preset='fast',
+                ffmpeg_params=['-crf', '28']
+            )
+        print(monitor.summary())
+        if backend == "timeline":
+            print(f"Peak open clip sources: {composed_clip.peak_open}")
 
         # Cleanup resources
         final_clip.close()